@@ -0,0 +1,95 @@
+"""
+Micro-benchmark del camino de recepcion sincronico de common/protocol.py.
+Compara receive_frame (recv_into sobre buffer preasignado, usado por
+receive_message) con la version anterior que concatenaba chunks de 4096 bytes,
+para frames de 1KB a 50MB. Se mide solo la lectura, sin decodificar el JSON.
+
+Uso (desde TP2/):
+    python benchmarks/bench_receive.py
+    python benchmarks/bench_receive.py --read-size 65536 --repeat 5
+"""
+
+import argparse
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from common.protocol import receive_frame
+
+
+SIZES = [
+    ('1KB', 1024),
+    ('64KB', 64 * 1024),
+    ('1MB', 1024 * 1024),
+    ('10MB', 10 * 1024 * 1024),
+    ('50MB', 50 * 1024 * 1024),
+]
+
+
+# Recepcion anterior: data += chunk con lecturas de 4096 bytes
+def receive_concat(sock) -> bytes:
+    length = struct.unpack('!I', sock.recv(4))[0]
+    data = b''
+    while len(data) < length:
+        chunk = sock.recv(min(length - len(data), 4096))
+        if not chunk:
+            raise ConnectionError("Conexión cerrada")
+        data += chunk
+    return data
+
+
+# Mide el tiempo de recibir un frame ya armado por un socketpair
+def measure(frame: bytes, receiver, repeat: int) -> float:
+    best = float('inf')
+
+    for _ in range(repeat):
+        sender, receiver_sock = socket.socketpair()
+        writer = threading.Thread(target=sender.sendall, args=(frame,))
+
+        start = time.perf_counter()
+        writer.start()
+        receiver(receiver_sock)
+        elapsed = time.perf_counter() - start
+
+        writer.join()
+        sender.close()
+        receiver_sock.close()
+        best = min(best, elapsed)
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de receive_frame')
+    parser.add_argument('--read-size', type=int, default=256 * 1024, help='Bytes por lectura (default: 262144)')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por tamaño, se toma el mejor (default: 3)')
+    parser.add_argument('--skip-concat-over', type=int, default=10 * 1024 * 1024,
+                        help='No medir la version anterior para frames mayores a estos bytes (default: 10MB)')
+    args = parser.parse_args()
+
+    print(f"{'Tamaño':>8} | {'recv_into MB/s':>15} | {'concat MB/s':>12}")
+    print("-" * 42)
+
+    for label, size in SIZES:
+        payload = b'x' * size
+        frame = struct.pack('!I', len(payload)) + payload
+        mb = len(frame) / (1024 * 1024)
+
+        new = measure(frame, lambda s: receive_frame(s, read_size=args.read_size), args.repeat)
+
+        if size <= args.skip_concat_over:
+            old = measure(frame, receive_concat, args.repeat)
+            old_rate = f"{mb / old:12.1f}"
+        else:
+            old_rate = f"{'-':>12}"
+
+        print(f"{label:>8} | {mb / new:15.1f} | {old_rate}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Verifica que los dos motores de parseo de scraper/page_analyzer.py den el mismo
+resultado: analyze_page(html, url, 'lxml') == analyze_page(html, url, 'bs4')
+sobre paginas de ejemplo (titulo, links, estructura, imagenes y metadatos), y
+opcionalmente sobre archivos HTML propios.
+
+Uso (desde TP2/):
+    python benchmarks/check_parser_backends.py
+    python benchmarks/check_parser_backends.py pagina1.html pagina2.html
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scraper import analyze_page
+
+
+BASE_URL = 'https://example.com/blog/post.html'
+
+PAGES = {
+    'articulo': """<!DOCTYPE html>
+<html lang="es"><head>
+  <meta charset="utf-8">
+  <title>  Noticias &amp; Novedades  </title>
+  <meta name="description" content="  Resumen del articulo ">
+  <meta name="keywords" content="python, scraping">
+  <meta name="description" content="duplicada, se ignora">
+  <meta property="og:title" content="Titulo OG">
+  <meta property="og:image" content="/img/portada.jpg">
+  <meta property="og:empty" content="">
+  <meta property="twitter:card" content="summary">
+</head><body>
+  <header><nav>
+    <a href="/">Inicio</a> <a href="/blog/">Blog</a> <a href="#top">Arriba</a>
+    <a href="javascript:void(0)">Menu</a> <a>sin href</a> <a href="   ">vacio</a>
+  </nav></header>
+  <main>
+    <h1>Titulo <em>principal</em></h1>
+    <h2>Seccion 1</h2><p>Texto con <a href="otro.html">link relativo</a>.</p>
+    <h2>Seccion 2</h2><h3>Sub</h3><h3>Sub</h3><h4>a</h4><h5>b</h5><h6>c</h6>
+    <img src="a.png"><img src="b.png" alt="b"><picture><source srcset="c.webp"><img src="c.jpg"></picture>
+    <a href="https://otro.com/x?y=1#frag">externo</a> <a href="/">Inicio repetido</a>
+  </main>
+  <!-- comentario <a href="/oculto">no cuenta</a> -->
+  <script>var s = '<a href="/script">no</a>';</script>
+</body></html>""",
+
+    'sin_title': """<html><head><meta name="keywords" content="sin titulo"></head>
+<body><h1>  Encabezado <span>compuesto</span>  </h1><h1>Segundo</h1></body></html>""",
+
+    'title_vacio': """<html><head><title></title></head><body><h1>Desde el h1</h1></body></html>""",
+
+    'title_anidado': """<html><head><title><b>raro</b></title></head><body><h2>x</h2></body></html>""",
+
+    'sin_encabezados': """<html><body><p>Solo texto</p><a href="mailto:a@b.com">mail</a></body></html>""",
+
+    'mal_formado': """<html><head><title>Roto<body><p>parrafo sin cerrar<div><a href=/sin-comillas>x</a>
+<h2>abierto<h3>anidado</h2><img src=x.png><table><tr><td><a href="/celda">c</td></tr></table>
+<meta property="og:description" content=" fuera del head ">""",
+
+    'entidades_unicode': """<html><head><title>Café — «ñandú» &lt;tag&gt; &#128512;</title>
+<meta name="description" content="áéíóú &quot;comillas&quot;"></head>
+<body><a href="/búsqueda?q=año">unicode</a><a href="/b%C3%BAsqueda">escapado</a></body></html>""",
+
+    'fragmento': """<p>Fragmento sin html ni body</p><a href="rel">r</a><img src="i.gif"><h3>h</h3>""",
+
+    'vacia': "",
+}
+
+
+# Compara ambos motores sobre un HTML, devuelve las claves que difieren
+def compare(html: str, base_url: str):
+    lxml_result = analyze_page(html, base_url, 'lxml')
+    bs4_result = analyze_page(html, base_url, 'bs4')
+    return [key for key in bs4_result if lxml_result.get(key) != bs4_result[key]], lxml_result, bs4_result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compara los motores de parseo lxml y bs4')
+    parser.add_argument('files', nargs='*', help='Archivos HTML adicionales a comparar')
+    parser.add_argument('--base-url', default=BASE_URL, help=f'URL base para los links (default: {BASE_URL})')
+    args = parser.parse_args()
+
+    pages = dict(PAGES)
+    for path in args.files:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            pages[path] = f.read()
+
+    failures = 0
+    for name, html in pages.items():
+        diff, lxml_result, bs4_result = compare(html, args.base_url)
+        if diff:
+            failures += 1
+            print(f"DIFERENTE {name}")
+            for key in diff:
+                print(f"  {key}:\n    lxml: {lxml_result.get(key)!r}\n    bs4:  {bs4_result[key]!r}")
+        else:
+            print(f"OK        {name}")
+
+    print(f"\n{len(pages) - failures}/{len(pages)} paginas con resultados identicos")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,14 +5,14 @@ import json
 from typing import Dict
 
 # Inicia scrapping de la URL y devuelve el task_id
-def scrape_async(server_url: str, target_url: str) -> str:
+def scrape_async(server_url: str, target_url: str, priority: str = 'interactive') -> str:
     endpoint = f"{server_url}/scrape"
     
     print(f"Enviando request para scrappear la url: {target_url}")
 
     response = requests.post(
         endpoint,
-        json={'url': target_url},
+        json={'url': target_url, 'priority': priority},
         timeout=10
     )
     
@@ -174,6 +174,13 @@ def main():
         '-o', '--output',
         help='Guardar resultado en archivo JSON'
     )
+
+    parser.add_argument(
+        '--priority',
+        choices=['interactive', 'normal', 'bulk'],
+        default='interactive',
+        help='Prioridad del scraping en el servidor de procesamiento (default: interactive)'
+    )
     
     args = parser.parse_args()
 
@@ -189,7 +196,7 @@ def main():
     result = None
 
     try: 
-        task_id = scrape_async(args.server, args.url) 
+        task_id = scrape_async(args.server, args.url, args.priority) 
         
         if task_id: 
             result = wait_for_completion(args.server, task_id) 
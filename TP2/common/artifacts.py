@@ -0,0 +1,102 @@
+import base64
+import os
+import uuid
+import weakref
+from typing import Dict, Iterator, List
+
+
+# Archivo binario (screenshot o thumbnail) recibido por partes y guardado en disco.
+# serialize_data lo convierte a base64 recien al momento de responder.
+# El archivo se borra cuando el objeto deja de estar referenciado (el cache lo desalojo
+# o vencio y ninguna tarea conserva el resultado), sin depender de quien lo libero ultimo.
+class FileArtifact:
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        weakref.finalize(self, _remove_file, path)
+
+    def read(self) -> bytes:
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    # Lee el archivo de a partes de chunk_size bytes
+    def iter_chunks(self, chunk_size: int) -> Iterator[bytes]:
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    # Contenido en base64 de a partes; chunk_size se redondea a multiplo de 3 para que
+    # las partes se puedan concatenar
+    def iter_base64(self, chunk_size: int = 192 * 1024) -> Iterator[bytes]:
+        chunk_size -= chunk_size % 3
+        for chunk in self.iter_chunks(chunk_size):
+            yield base64.b64encode(chunk)
+
+    def __repr__(self):
+        return f"FileArtifact({self.path!r}, {self.size})"
+
+
+# Destino de los artefactos de una respuesta en streaming: los junta en memoria
+# en buffers preasignados con el tamaño anunciado.
+class MemoryArtifactSink:
+
+    def __init__(self):
+        self.buffers: Dict[int, bytearray] = {}
+        self.offsets: Dict[int, int] = {}
+
+    def open(self, index: int, size: int):
+        self.buffers[index] = bytearray(size)
+        self.offsets[index] = 0
+
+    def write(self, index: int, chunk: bytes):
+        offset = self.offsets[index]
+        self.buffers[index][offset:offset + len(chunk)] = chunk
+        self.offsets[index] = offset + len(chunk)
+
+    def close(self) -> List[bytes]:
+        return [bytes(self.buffers[i]) for i in sorted(self.buffers)]
+
+    def discard(self):
+        self.buffers.clear()
+
+
+# Destino de los artefactos que escribe cada parte directamente a un archivo,
+# asi la respuesta completa nunca se mantiene en memoria.
+class FileArtifactSink:
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.files = {}
+        self.paths: Dict[int, str] = {}
+        self.sizes: Dict[int, int] = {}
+
+    def open(self, index: int, size: int):
+        path = os.path.join(self.directory, uuid.uuid4().hex)
+        self.files[index] = open(path, 'wb')
+        self.paths[index] = path
+        self.sizes[index] = size
+
+    def write(self, index: int, chunk: bytes):
+        self.files[index].write(chunk)
+
+    def close(self) -> List[FileArtifact]:
+        for f in self.files.values():
+            f.close()
+        return [FileArtifact(self.paths[i], self.sizes[i]) for i in sorted(self.paths)]
+
+    def discard(self):
+        for f in self.files.values():
+            f.close()
+        for path in self.paths.values():
+            _remove_file(path)
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -13,6 +13,11 @@ class NetworkError(Exception):
     pass
 
 
+class ConnectionClosedError(NetworkError):
+    """El otro extremo cerró la conexión"""
+    pass
+
+
 class TimeoutError(Exception):
     """Error de timeout en operaciones"""
     pass
@@ -28,6 +33,25 @@ class RateLimitError(ScrapingError):
     pass
 
 
+class ContentTooLargeError(ScrapingError):
+    """El contenido descargado excede el tamaño máximo permitido"""
+    pass
+
+
 class CacheError(Exception):
     """Error relacionado con el caché"""
-    pass
\ No newline at end of file
+    pass
+
+class UnsupportedImageError(ProcessingError):
+    """El recurso no es una imagen que se pueda convertir en thumbnail"""
+    pass
+
+
+class TaskCancelledError(ProcessingError):
+    """La tarea fue cancelada antes de terminar"""
+    pass
+
+
+class PoolFullError(ProcessingError):
+    """La cola del pool de procesos está llena"""
+    pass
@@ -1,13 +1,182 @@
 import struct
 import json
 import asyncio
-from typing import Dict, Any
-from .errors import NetworkError
-from time import time
+import time
+import uuid
+import zlib
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
+from .errors import NetworkError, ConnectionClosedError
+from .artifacts import FileArtifact
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Formatos de mensaje. Todos los frames llevan un prefijo de 4 bytes con el largo.
+#  - JSON (formato original): el payload es el JSON en utf-8, siempre empieza con '{'.
+#  - Binario: BINARY_MARKER + id de compresion (1 byte) + cuerpo, posiblemente comprimido.
+#    El cuerpo es el largo del JSON (4 bytes) + JSON + los campos bytes en crudo, cada uno
+#    con su largo (4 bytes). En el JSON cada campo bytes se reemplaza por {"__bin__": indice}.
+# El receptor detecta el formato de cada frame, por lo que siempre acepta JSON de peers viejos.
+# El emisor solo usa el formato binario si el otro extremo lo anuncio con 'accept'.
+BINARY_MARKER = 0x00
+COMPRESSION_IDS = {None: 0, 'zlib': 1, 'zstd': 2}
+SUPPORTED_COMPRESSION = ['zstd', 'zlib'] if zstandard else ['zlib']
+MIN_COMPRESS_SIZE = 1024
+DEFAULT_READ_SIZE = 256 * 1024
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Campo 'accept' que un cliente agrega a sus requests para recibir respuestas binarias
+ACCEPT = {'encodings': ['binary'], 'compression': SUPPORTED_COMPRESSION}
+
+
+# Elige formato, compresion y si la respuesta va en streaming segun el 'accept' del request
+def negotiate(accept: Optional[Dict[str, Any]]) -> Tuple[bool, Optional[str], bool]:
+    if not accept or 'binary' not in accept.get('encodings', []):
+        return False, None, False
+
+    compression = next(
+        (c for c in accept.get('compression', []) if c in SUPPORTED_COMPRESSION),
+        None
+    )
+    return True, compression, bool(accept.get('stream'))
+
+
+# Respuesta en streaming: los campos bytes (artefactos) se envian aparte, por partes.
+#  1. {'stream': 'start', 'data': respuesta con {"__artifact__": i}, 'artifacts': [tamaños]}
+#  2. {'stream': 'chunk', 'artifact': i, 'data': bytes} por cada parte de cada artefacto
+#  3. {'stream': 'end'}
+# Todos los frames llevan el 'request_id', asi pueden intercalarse con otras respuestas.
+# Un artefacto puede ser bytes o un FileArtifact; este ultimo se lee del archivo de a una
+# parte, sin cargarlo entero en memoria.
+def iter_stream_frames(data: Dict[str, Any], request_id: Optional[str],
+                       chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    artifacts: List[Any] = []
+    header = _extract_artifacts(data, artifacts)
+
+    yield {'request_id': request_id, 'stream': 'start', 'data': header,
+           'artifacts': [a.size if isinstance(a, FileArtifact) else len(a) for a in artifacts]}
+
+    for index, artifact in enumerate(artifacts):
+        for chunk in _artifact_chunks(artifact, chunk_size):
+            yield {'request_id': request_id, 'stream': 'chunk', 'artifact': index, 'data': chunk}
+
+    yield {'request_id': request_id, 'stream': 'end'}
+
+
+def _artifact_chunks(artifact: Any, chunk_size: int) -> Iterator[bytes]:
+    if isinstance(artifact, FileArtifact):
+        yield from artifact.iter_chunks(chunk_size)
+        return
+
+    view = memoryview(artifact)
+    for offset in range(0, len(artifact), chunk_size):
+        yield view[offset:offset + chunk_size]
+
+
+# Codifica un mensaje como payload de frame (sin el prefijo de largo)
+def encode_message(data: Dict[str, Any], binary: bool = False, compression: Optional[str] = None) -> bytes:
+    if not binary:
+        return json.dumps(data).encode('utf-8')
+
+    blobs: List[bytes] = []
+    header = json.dumps(_extract_blobs(data, blobs)).encode('utf-8')
+
+    parts = [struct.pack('!I', len(header)), header]
+    for blob in blobs:
+        parts.append(struct.pack('!I', len(blob)))
+        parts.append(blob)
+    body = b''.join(parts)
+
+    if compression and len(body) < MIN_COMPRESS_SIZE:
+        compression = None
+    if compression == 'zlib':
+        body = zlib.compress(body, 6)
+    elif compression == 'zstd':
+        body = zstandard.ZstdCompressor(level=3).compress(body)
+    elif compression is not None:
+        raise ValueError(f"Compresión no soportada: {compression}")
+
+    return bytes([BINARY_MARKER, COMPRESSION_IDS[compression]]) + body
+
+
+# Decodifica el payload de un frame en cualquiera de los dos formatos
+def decode_message(payload: bytes) -> Dict[str, Any]:
+    if not payload or payload[0] != BINARY_MARKER:
+        return json.loads(payload.decode('utf-8'))
+
+    compression_id = payload[1]
+    body = memoryview(payload)[2:]
+    if compression_id == COMPRESSION_IDS['zlib']:
+        body = memoryview(zlib.decompress(body))
+    elif compression_id == COMPRESSION_IDS['zstd']:
+        if zstandard is None:
+            raise NetworkError("Mensaje comprimido con zstd pero 'zstandard' no está instalado")
+        body = memoryview(zstandard.ZstdDecompressor().decompress(body))
+    elif compression_id != COMPRESSION_IDS[None]:
+        raise NetworkError(f"Compresión desconocida: {compression_id}")
+
+    header_len = struct.unpack_from('!I', body, 0)[0]
+    header = json.loads(str(body[4:4 + header_len], 'utf-8'))
+
+    blobs = []
+    offset = 4 + header_len
+    while offset < len(body):
+        blob_len = struct.unpack_from('!I', body, offset)[0]
+        offset += 4
+        blobs.append(bytes(body[offset:offset + blob_len]))
+        offset += blob_len
+
+    return _restore_blobs(header, blobs)
+
+
+def _extract_blobs(obj, blobs: List[bytes]):
+    if isinstance(obj, dict):
+        return {k: _extract_blobs(v, blobs) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_extract_blobs(v, blobs) for v in obj]
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        blobs.append(bytes(obj))
+        return {'__bin__': len(blobs) - 1}
+    return obj
+
+
+def _extract_artifacts(obj, artifacts: List[bytes]):
+    if isinstance(obj, dict):
+        return {k: _extract_artifacts(v, artifacts) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_extract_artifacts(v, artifacts) for v in obj]
+    if isinstance(obj, (bytes, bytearray, FileArtifact)):
+        artifacts.append(obj)
+        return {'__artifact__': len(artifacts) - 1}
+    return obj
+
+
+def _restore_artifacts(obj, artifacts: List[Any]):
+    if isinstance(obj, dict):
+        if set(obj) == {'__artifact__'}:
+            return artifacts[obj['__artifact__']]
+        return {k: _restore_artifacts(v, artifacts) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_restore_artifacts(v, artifacts) for v in obj]
+    return obj
+
+
+def _restore_blobs(obj, blobs: List[bytes]):
+    if isinstance(obj, dict):
+        if set(obj) == {'__bin__'}:
+            return blobs[obj['__bin__']]
+        return {k: _restore_blobs(v, blobs) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_restore_blobs(v, blobs) for v in obj]
+    return obj
 
 # Envio de mensaje utilizado por server_processing
-def send_message(sock, data: Dict[str, Any], retries: int = 3, delay: int = 1) -> None:
-    message = json.dumps(data).encode('utf-8')
+def send_message(sock, data: Dict[str, Any], retries: int = 3, delay: int = 1,
+                 binary: bool = False, compression: Optional[str] = None) -> None:
+    message = encode_message(data, binary, compression)
     length = struct.pack('!I', len(message))
 
     for attempt in range(retries):
@@ -25,24 +194,10 @@ def send_message(sock, data: Dict[str, Any], retries: int = 3, delay: int = 1) -
 
 
 # Recibir mensaje utilizado por server_processing
-def receive_message(sock, retries: int = 3, delay: int = 1) -> Dict[str, Any]:
+def receive_message(sock, retries: int = 3, delay: int = 1, read_size: int = DEFAULT_READ_SIZE) -> Dict[str, Any]:
     for attempt in range(retries):
         try:
-            
-            length_bytes = sock.recv(4)
-            if not length_bytes or len(length_bytes) < 4:
-                raise NetworkError("Conexión cerrada o datos incompletos")
-            
-            length = struct.unpack('!I', length_bytes)[0]
-            
-            data = b''
-            while len(data) < length:
-                chunk = sock.recv(min(length - len(data), 4096))
-                if not chunk:
-                    raise NetworkError("Conexión cerrada antes de recibir mensaje completo")
-                data += chunk
-            
-            return json.loads(data.decode('utf-8'))
+            return decode_message(receive_frame(sock, read_size))
         
         except (TimeoutError, ConnectionResetError) as e:
             if attempt < retries-1:
@@ -54,13 +209,41 @@ def receive_message(sock, retries: int = 3, delay: int = 1) -> Dict[str, Any]:
         except json.JSONDecodeError as e:
             raise NetworkError(f"Error al decodificar JSON: {e}")
 
+        except NetworkError:
+            raise
+
         except Exception as e:
             raise NetworkError(f"Error inesperado al recibir mensaje: {e}")
 
 
+# Lee un frame completo (header de largo + payload) y devuelve el payload sin decodificar
+def receive_frame(sock, read_size: int = DEFAULT_READ_SIZE) -> bytearray:
+    length_bytes = _recv_exactly(sock, 4, read_size, at_message_start=True)
+    length = struct.unpack('!I', length_bytes)[0]
+    return _recv_exactly(sock, length, read_size)
+
+
+# Lee exactamente n bytes sobre un buffer preasignado, sin concatenar chunks
+def _recv_exactly(sock, n: int, read_size: int = DEFAULT_READ_SIZE, at_message_start: bool = False) -> bytearray:
+    buffer = bytearray(n)
+    view = memoryview(buffer)
+    received = 0
+
+    while received < n:
+        count = sock.recv_into(view[received:], min(n - received, read_size))
+        if count == 0:
+            if at_message_start and received == 0:
+                raise ConnectionClosedError("Conexión cerrada por el otro extremo")
+            raise NetworkError("Conexión cerrada antes de recibir mensaje completo")
+        received += count
+
+    return buffer
+
+
 # Envio de mensaje utilizado por server_scrapping
-async def async_send_message(writer: asyncio.StreamWriter, data: Dict[str, Any], retries: int = 3, delay: int = 1) -> None:
-    message = json.dumps(data).encode('utf-8')
+async def async_send_message(writer: asyncio.StreamWriter, data: Dict[str, Any], retries: int = 3, delay: int = 1,
+                             binary: bool = False, compression: Optional[str] = None) -> None:
+    message = encode_message(data, binary, compression)
     length = struct.pack('!I', len(message))
 
     for attempt in range(retries):
@@ -82,10 +265,15 @@ async def async_send_message(writer: asyncio.StreamWriter, data: Dict[str, Any],
 async def async_receive_message(reader: asyncio.StreamReader, retries: int = 3, delay: int = 1) -> Dict[str, Any]:
     for attempt in range(retries):
         try:
-            length_bytes = await reader.readexactly(4)
+            try:
+                length_bytes = await reader.readexactly(4)
+            except asyncio.IncompleteReadError as e:
+                if not e.partial:
+                    raise ConnectionClosedError("Conexión cerrada por el otro extremo")
+                raise
             length = struct.unpack('!I', length_bytes)[0]
             data = await reader.readexactly(length)
-            return json.loads(data.decode('utf-8'))
+            return decode_message(data)
         
         except (asyncio.IncompleteReadError, ConnectionResetError) as e:
             if attempt < retries-1:
@@ -97,5 +285,161 @@ async def async_receive_message(reader: asyncio.StreamReader, retries: int = 3,
         except json.JSONDecodeError as e:
             raise NetworkError(f"Error al decodificar JSON: {e}")
 
+        except NetworkError:
+            raise
+
+        except Exception as e:
+            raise NetworkError(f"Error inesperado al recibir mensaje async: {e}")
+
+
+# Conexion persistente con el servidor de procesamiento que multiplexa varias
+# requests a la vez. Cada mensaje lleva un 'request_id' y las respuestas se
+# entregan a quien las espera aunque lleguen en otro orden.
+# Si el request se hace con un sink_factory, se pide la respuesta en streaming y sus
+# artefactos se escriben en el sink a medida que llegan (ver common/artifacts.py).
+class MultiplexedConnection:
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.sink_factories: Dict[str, Callable] = {}
+        self.streams: Dict[str, Dict[str, Any]] = {}
+        self.write_lock = asyncio.Lock()
+        self.cancel_tasks = set()
+        self.closed = False
+        self.reader_task = asyncio.create_task(self._read_loop())
+
+    @classmethod
+    async def open(cls, host: str, port: int) -> 'MultiplexedConnection':
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.pending)
+
+    # Envia un request y espera su respuesta
+    async def request(self, data: Dict[str, Any], timeout: Optional[float] = None,
+                      sink_factory: Optional[Callable] = None) -> Dict[str, Any]:
+        if self.closed:
+            raise ConnectionClosedError("La conexión con el servidor de procesamiento está cerrada")
+
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+
+        accept = ACCEPT
+        if sink_factory:
+            self.sink_factories[request_id] = sink_factory
+            accept = {**ACCEPT, 'stream': True}
+
+        try:
+            async with self.write_lock:
+                await async_send_message(
+                    self.writer,
+                    {**data, 'request_id': request_id, 'accept': accept},
+                    retries=1
+                )
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # Se abandona el request: el servidor puede cancelar sus tareas
+            self._send_cancel(request_id)
+            raise
+        finally:
+            self.pending.pop(request_id, None)
+            self.sink_factories.pop(request_id, None)
+
+    # Avisa al servidor que el request fue abandonado, sin esperar el envio
+    def _send_cancel(self, request_id: str):
+        if self.closed:
+            return
+
+        async def _send():
+            try:
+                async with self.write_lock:
+                    await async_send_message(self.writer, {'cancel': request_id}, retries=1)
+            except Exception as e:
+                print(f"[WARN] No se pudo enviar la cancelación del request {request_id}: {e}")
+
+        task = asyncio.ensure_future(_send())
+        self.cancel_tasks.add(task)
+        task.add_done_callback(self.cancel_tasks.discard)
+
+    async def close(self):
+        self.closed = True
+        self.reader_task.cancel()
+        await asyncio.gather(self.reader_task, return_exceptions=True)
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+    # Lee respuestas y las despacha segun su request_id
+    async def _read_loop(self):
+        try:
+            while True:
+                response = await async_receive_message(self.reader, retries=1)
+                request_id = response.pop('request_id', None)
+
+                if 'stream' in response:
+                    self._handle_stream_frame(request_id, response)
+                    continue
+
+                future = self.pending.get(request_id)
+                if future and not future.done():
+                    future.set_result(response)
+                elif future is None:
+                    print("[WARN] Respuesta sin request pendiente, se descarta")
+
+        except asyncio.CancelledError:
+            pass
+
         except Exception as e:
-            raise NetworkError(f"Error inesperado al recibir mensaje async: {e}")
\ No newline at end of file
+            print(f"Conexión con servidor de procesamiento cerrada: {e}")
+
+        finally:
+            self.closed = True
+            for stream in self.streams.values():
+                if stream['sink']:
+                    stream['sink'].discard()
+            self.streams.clear()
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionClosedError("Se cerró la conexión antes de recibir la respuesta"))
+
+    # Procesa un frame de una respuesta en streaming
+    def _handle_stream_frame(self, request_id: str, frame: Dict[str, Any]):
+        kind = frame['stream']
+
+        if kind == 'start':
+            factory = self.sink_factories.get(request_id)
+            sink = factory() if factory and request_id in self.pending else None
+            if sink:
+                for index, size in enumerate(frame['artifacts']):
+                    sink.open(index, size)
+            self.streams[request_id] = {'data': frame['data'], 'sink': sink}
+            return
+
+        stream = self.streams.get(request_id)
+        if stream is None:
+            return
+
+        sink = stream['sink']
+        if kind == 'chunk':
+            if sink:
+                sink.write(frame['artifact'], frame['data'])
+            return
+
+        del self.streams[request_id]
+        if not sink:
+            return
+
+        future = self.pending.get(request_id)
+        if future is None or future.done():
+            # El request ya expiro, se descartan los artefactos recibidos
+            sink.discard()
+            return
+
+        future.set_result(_restore_artifacts(stream['data'], sink.close()))
@@ -1,7 +1,9 @@
 import json
 import base64
-from typing import Any, Dict
+import uuid
+from typing import Any, Dict, List, Tuple
 from datetime import datetime
+from .artifacts import FileArtifact
 
 # serializador a JSON
 def serialize_data(data: Dict[str, Any]) -> str:
@@ -10,11 +12,44 @@ def serialize_data(data: Dict[str, Any]) -> str:
             return obj.isoformat()
         elif isinstance(obj, bytes):
             return base64.b64encode(obj).decode('utf-8')
+        elif isinstance(obj, FileArtifact):
+            return base64.b64encode(obj.read()).decode('utf-8')
         raise TypeError(f"Tipo {type(obj)} no serializable")
     
     return json.dumps(data, default=default_serializer, ensure_ascii=False)
 
 
+# Serializa a JSON dejando afuera los FileArtifact: devuelve los fragmentos de JSON y los
+# artefactos que van entre ellos (fragmento, artefacto, fragmento, ...). Cada artefacto se
+# escribe luego como string base64 leyendo su archivo por partes (FileArtifact.iter_base64),
+# sin armar el JSON completo en memoria.
+def serialize_parts(data: Dict[str, Any]) -> Tuple[List[str], List[FileArtifact]]:
+    token = uuid.uuid4().hex
+    artifacts = []
+
+    def default_serializer(obj):
+        if isinstance(obj, FileArtifact):
+            artifacts.append(obj)
+            return f"{token}:{len(artifacts) - 1}"
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        elif isinstance(obj, bytes):
+            return base64.b64encode(obj).decode('utf-8')
+        raise TypeError(f"Tipo {type(obj)} no serializable")
+
+    text = json.dumps(data, default=default_serializer, ensure_ascii=False)
+
+    parts = []
+    start = 0
+    for index in range(len(artifacts)):
+        placeholder = f'"{token}:{index}"'
+        position = text.index(placeholder, start)
+        parts.append(text[start:position + 1])
+        start = position + len(placeholder) - 1
+    parts.append(text[start:])
+    return parts, artifacts
+
+
 # deserializador de JSON a diccionario
 def deserialize_data(json_str: str) -> Dict[str, Any]:
     return json.loads(json_str)
\ No newline at end of file
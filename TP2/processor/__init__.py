@@ -2,13 +2,17 @@
 Módulo de procesamiento intensivo (CPU-bound tasks).
 """
 
-from .screenshot import generate_screenshot
+from .screenshot import generate_screenshot, capture_page, init_browser_pool
 from .performance import analyze_performance
 from .image_processor import process_images, generate_thumbnail
+from .thumbnail_cache import init_thumbnail_cache
 
 __all__ = [
     'generate_screenshot',
+    'capture_page',
+    'init_browser_pool',
     'analyze_performance',
     'process_images',
-    'generate_thumbnail'
+    'generate_thumbnail',
+    'init_thumbnail_cache'
 ]
\ No newline at end of file
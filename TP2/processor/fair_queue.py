@@ -0,0 +1,70 @@
+import heapq
+import itertools
+import threading
+from typing import Any, Dict, Optional
+
+
+# Niveles de prioridad, de mayor a menor
+PRIORITIES = ('interactive', 'normal', 'bulk')
+DEFAULT_PRIORITY = 'normal'
+
+
+# Cola del pool con prioridades y reparto justo entre flujos (cliente o dominio).
+# Un nivel de prioridad se atiende solo si los de mayor prioridad estan vacios. Dentro de
+# cada nivel se usa weighted fair queuing: cada tarea recibe una etiqueta de fin virtual
+# (max(tiempo virtual, fin de la ultima tarea del flujo) + 1/peso) y se atiende la menor,
+# asi un flujo con muchas tareas encoladas no demora a los demas mas que su parte.
+# Un None encolado (fin de una thread del pool) se entrega cuando ya no quedan tareas.
+class FairQueue:
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        self.weights = weights or {}
+        self.cond = threading.Condition()
+        self.heaps = {priority: [] for priority in PRIORITIES}
+        self.virtual_time = {priority: 0.0 for priority in PRIORITIES}
+        self.last_finish = {priority: {} for priority in PRIORITIES}
+        self.counter = itertools.count()
+        self.sentinels = 0
+
+    def put(self, job: Any, priority: str = DEFAULT_PRIORITY, flow: Optional[str] = None):
+        with self.cond:
+            if job is None:
+                self.sentinels += 1
+            else:
+                if priority not in self.heaps:
+                    priority = DEFAULT_PRIORITY
+                weight = self.weights.get(flow, 1.0)
+                start = max(self.virtual_time[priority], self.last_finish[priority].get(flow, 0.0))
+                finish = start + 1.0 / weight
+                self.last_finish[priority][flow] = finish
+                heapq.heappush(self.heaps[priority], (finish, next(self.counter), job))
+            self.cond.notify()
+
+    # Devuelve la proxima tarea, esperando si no hay ninguna
+    def get(self) -> Any:
+        with self.cond:
+            while True:
+                for priority in PRIORITIES:
+                    heap = self.heaps[priority]
+                    if heap:
+                        finish, _, job = heapq.heappop(heap)
+                        self.virtual_time[priority] = finish
+                        if not heap:
+                            # Nivel vacio: los flujos inactivos no acumulan credito
+                            self.virtual_time[priority] = 0.0
+                            self.last_finish[priority].clear()
+                        return job
+
+                if self.sentinels:
+                    self.sentinels -= 1
+                    return None
+
+                self.cond.wait()
+
+    def qsize(self) -> int:
+        with self.cond:
+            return sum(len(heap) for heap in self.heaps.values())
+
+    def sizes(self) -> Dict[str, int]:
+        with self.cond:
+            return {priority: len(heap) for priority, heap in self.heaps.items()}
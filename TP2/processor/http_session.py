@@ -0,0 +1,23 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+
+POOL_MAXSIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# Sesion HTTP del proceso worker, compartida por las tareas y sus threads para
+# reutilizar las conexiones keep-alive entre requests al mismo host
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers['User-Agent'] = 'Mozilla/5.0 Web Scraper Bot'
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=POOL_MAXSIZE)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
@@ -1,20 +1,43 @@
 import time
 import io
 import base64
+import hashlib
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from typing import List, Dict, Tuple
-from common.errors import ProcessingError
+from typing import List, Dict, Optional, Tuple
+from common.errors import ProcessingError, UnsupportedImageError
+from processor.http_session import get_session
+from processor.thumbnail_cache import get_thumbnail_cache
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+import re
+from urllib.parse import urljoin, urldefrag, urlsplit, urlunsplit
 
 
-# Extrae imagenes de la URL y las envia a procesar
-def extract_and_process_images(url: str, max_images: int = 5):
+IMAGE_WORKERS = 8
+THUMBNAIL_SIZE = (200, 200)
+SOURCE_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif')
+_SIZES_PX = re.compile(r'^(\d+(?:\.\d+)?)px$')
+
+
+# Extrae imagenes de la URL y las envia a procesar.
+# Si se recibe el html ya descargado por el servidor de scraping no se vuelve a descargar.
+def extract_and_process_images(url: str, max_images: int = 5, html: Optional[str] = None,
+                               base_url: Optional[str] = None):
         max_size_html = 5 * 1024 * 1024
         retries=3
         delay=1
 
+        if html is not None:
+            if len(html.encode('utf-8')) > max_size_html:
+                raise ProcessingError(
+                    f"La página {url} excede el tamaño máximo permitido de {max_size_html / (1024*1024)} MB"
+                )
+            try:
+                return _process_page_images(html, base_url or url, max_images)
+            except Exception as e:
+                raise ProcessingError(f"Error inesperado al procesar imágenes de {url}: {e}")
+
         for attempt in range(retries):
             try:
                 response = requests.get(
@@ -29,14 +52,7 @@ def extract_and_process_images(url: str, max_images: int = 5):
                         f"La página {url} excede el tamaño máximo permitido de {max_size_html / (1024*1024)} MB"
                 )
 
-                html = BeautifulSoup(response.text, 'lxml')
-                
-                image_urls = []
-                for img in html.find_all('img', src=True)[:max_images * 2]:
-                    src = urljoin(url, img['src'])
-                    image_urls.append(src)
-                
-                return process_images(image_urls[:max_images], max_images)
+                return _process_page_images(response.text, url, max_images)
             
             except requests.RequestException as e:
                 if attempt < retries - 1:
@@ -53,7 +69,138 @@ def extract_and_process_images(url: str, max_images: int = 5):
                 raise ProcessingError(f"Error inesperado al procesar imágenes de {url}: {e}")
 
 
-# Procesa las imagenes individualemente
+# Busca las imagenes del html y las envia a procesar.
+# De cada imagen se elige la version mas chica que alcance para el thumbnail (src, srcset
+# o <source> de un <picture>) y las URLs repetidas se procesan una sola vez.
+def _process_page_images(html_text: str, base_url: str, max_images: int):
+    html = BeautifulSoup(html_text, 'lxml')
+    
+    image_urls = []
+    seen = set()
+    for img in html.find_all('img'):
+        src = select_image_source(img, base_url, THUMBNAIL_SIZE[0])
+        if src is None or src in seen:
+            continue
+        seen.add(src)
+        image_urls.append(src)
+        if len(image_urls) >= max_images:
+            break
+    
+    return process_images(image_urls, max_images)
+
+
+# Elige entre los candidatos de la imagen el de menor ancho que sea al menos target_width.
+# Si ninguno llega se prefiere un candidato de ancho desconocido (el de menor densidad,
+# normalmente el src) y si no hay, el mas grande.
+def select_image_source(img, base_url: str, target_width: int) -> Optional[str]:
+    candidates = []
+    layout_width = _layout_width(img)
+
+    picture = img.find_parent('picture')
+    if picture is not None:
+        for source in picture.find_all('source', srcset=True):
+            source_type = source.get('type', '').lower()
+            if source_type and source_type not in SOURCE_TYPES:
+                continue
+            candidates.extend(_parse_srcset(source['srcset'], _layout_width(source) or layout_width))
+
+    if img.get('srcset'):
+        candidates.extend(_parse_srcset(img['srcset'], layout_width))
+    if img.get('src'):
+        candidates.append((img['src'], layout_width, 1.0))
+
+    urls = {}
+    for url, width, density in candidates:
+        url = normalize_image_url(url, base_url)
+        if url is not None and url not in urls:
+            urls[url] = (width, density)
+    if not urls:
+        return None
+
+    sized = [(width, url) for url, (width, _) in urls.items() if width]
+    large_enough = [item for item in sized if item[0] >= target_width]
+    if large_enough:
+        return min(large_enough)[1]
+
+    unsized = [(density < 1, density, url) for url, (width, density) in urls.items() if not width]
+    if unsized:
+        return min(unsized)[2]
+
+    return max(sized)[1]
+
+
+# Normaliza la URL de una imagen: absoluta, sin fragmento y con esquema y host en minusculas.
+# Devuelve None si no es http/https (data:, blob:, etc.)
+def normalize_image_url(url: str, base_url: str) -> Optional[str]:
+    url, _ = urldefrag(urljoin(base_url, url.strip()))
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ('http', 'https') or not parts.netloc:
+        return None
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', parts.query, ''))
+
+
+# Ancho de layout de la imagen en pixeles: atributo width o el valor por defecto de sizes
+def _layout_width(tag) -> Optional[float]:
+    width = tag.get('width', '').strip()
+    if width.isdigit():
+        return float(width)
+
+    sizes = tag.get('sizes', '').strip()
+    if sizes:
+        match = _SIZES_PX.match(sizes.split(',')[-1].strip())
+        if match:
+            return float(match.group(1))
+
+    return None
+
+
+# Parsea un srcset en (url, ancho, densidad). Con descriptor 'w' el ancho es el declarado;
+# con 'x' se estima como densidad x ancho de layout, si se conoce.
+def _parse_srcset(srcset: str, layout_width: Optional[float]) -> List[Tuple[str, Optional[float], float]]:
+    candidates = []
+    position = 0
+    length = len(srcset)
+
+    while position < length:
+        while position < length and (srcset[position].isspace() or srcset[position] == ','):
+            position += 1
+        start = position
+        while position < length and not srcset[position].isspace():
+            position += 1
+        url = srcset[start:position]
+        if not url:
+            break
+
+        descriptor = ''
+        if url.endswith(','):
+            url = url.rstrip(',')
+        else:
+            start = position
+            while position < length and srcset[position] != ',':
+                position += 1
+            descriptor = srcset[start:position].strip().lower()
+
+        width, density = None, 1.0
+        try:
+            if descriptor.endswith('w'):
+                width = float(descriptor[:-1])
+                density = width / layout_width if layout_width else 1.0
+            elif descriptor.endswith('x'):
+                density = float(descriptor[:-1])
+                width = density * layout_width if layout_width else None
+            elif layout_width:
+                width = layout_width
+        except ValueError:
+            continue
+
+        candidates.append((url, width, density))
+
+    return candidates
+
+
+# Procesa las imagenes en paralelo: las descargas se solapan sobre la sesion compartida
+# y la decodificacion y el redimensionado corren en los mismos threads (PIL libera el GIL).
+# Los resultados mantienen el orden de image_urls y cada imagen informa su propio error.
 def process_images(image_urls: List[str], max_images: int = 5) -> List[Dict[str, str]]:
     """
     Descarga y procesa imágenes generando thumbnails.
@@ -68,11 +215,18 @@ def process_images(image_urls: List[str], max_images: int = 5) -> List[Dict[str,
     Raises:
         ProcessingError: Si hay errores al procesar
     """
+    image_urls = image_urls[:max_images]
+    if not image_urls:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(IMAGE_WORKERS, len(image_urls))) as executor:
+        futures = [executor.submit(generate_thumbnail, url) for url in image_urls]
+
     results = []
     
-    for url in image_urls[:max_images]:
+    for url, future in zip(image_urls, futures):
         try:
-            thumbnail = generate_thumbnail(url)
+            thumbnail = future.result()
             if thumbnail:
                 results.append({
                     'original_url': url,
@@ -90,46 +244,92 @@ def process_images(image_urls: List[str], max_images: int = 5) -> List[Dict[str,
     return results
 
 
-# Genera thumbnails a partir de las imagenes
-def generate_thumbnail(image_url: str,size: Tuple[int, int] = (200, 200),quality: int = 85) -> str:
+# Genera thumbnails a partir de las imagenes.
+# Con la cache de thumbnails activa, una URL ya vista solo cuesta una busqueda, incluso si
+# no era una imagen soportada (SVG o contenido que no es imagen); y una imagen con el mismo contenido que otra ya procesada
+# solo cuesta la descarga.
+def generate_thumbnail(image_url: str, size: Tuple[int, int] = THUMBNAIL_SIZE, quality: int = 85) -> str:
+    cache = get_thumbnail_cache()
+    url_key = f"{size[0]}x{size[1]}:{quality}:{image_url}"
+
+    if cache is not None:
+        entry = cache.get_url(url_key)
+        if entry is not None:
+            content_hash, error = entry
+            if error is not None:
+                raise UnsupportedImageError(error)
+            thumbnail = cache.get_thumbnail(content_hash)
+            if thumbnail is not None:
+                return thumbnail
+
     try:
-        response = requests.get(
-            image_url,
-            timeout=10,
-            headers={'User-Agent': 'Mozilla/5.0 Web Scraper Bot'}
-        )
-        response.raise_for_status()
+        data = download_image(image_url)
+    except UnsupportedImageError as e:
+        if cache is not None:
+            cache.set_url(url_key, error=str(e))
+        raise
 
-        content_type = response.headers.get('Content-Type', '').lower()
-
-        if not content_type.startswith('image/'):
-            raise ProcessingError(
-                f"La URL no devuelve una imagen válida (Content-Type: {content_type})"
-            )
-
-        if 'svg' in content_type:
-            raise ProcessingError(
-                f"Formato SVG no soportado para la imagen: {image_url}"
-            )
-        
-        image = Image.open(io.BytesIO(response.content))
-        
-        if image.mode == 'RGBA':
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            background.paste(image, mask=image.split()[3])
-            image = background
-        elif image.mode not in ('RGB', 'L'):
-            image = image.convert('RGB')
-        
-        image.thumbnail(size, Image.Resampling.LANCZOS)
-        
-        buffer = io.BytesIO()
-        image.save(buffer, format='JPEG', quality=quality, optimize=True)
-        buffer.seek(0)
-        
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
-    
+    content_hash = f"{hashlib.sha256(data).hexdigest()}:{size[0]}x{size[1]}:{quality}"
+    thumbnail = cache.get_thumbnail(content_hash) if cache is not None else None
+
+    if thumbnail is None:
+        try:
+            thumbnail = make_thumbnail(data, size, quality)
+        except Exception as e:
+            # No se cachea: puede deberse a una descarga incompleta o a un error pasajero
+            raise ProcessingError(f"Error al procesar imagen {image_url}: {e}")
+
+        if cache is not None:
+            cache.set_thumbnail(content_hash, thumbnail)
+
+    if cache is not None:
+        cache.set_url(url_key, content_hash)
+
+    return thumbnail
+
+
+# Descarga la imagen con la sesion compartida y valida que sea un formato soportado
+def download_image(image_url: str) -> bytes:
+    try:
+        response = get_session().get(image_url, timeout=10)
+        response.raise_for_status()
     except requests.RequestException as e:
         raise ProcessingError(f"Error al descargar imagen {image_url}: {e}")
-    except Exception as e:
-        raise ProcessingError(f"Error al procesar imagen {image_url}: {e}")
\ No newline at end of file
+
+    content_type = response.headers.get('Content-Type', '').lower()
+
+    if not content_type.startswith('image/'):
+        raise UnsupportedImageError(
+            f"La URL no devuelve una imagen válida (Content-Type: {content_type})"
+        )
+
+    if 'svg' in content_type:
+        raise UnsupportedImageError(
+            f"Formato SVG no soportado para la imagen: {image_url}"
+        )
+
+    return response.content
+
+
+# Convierte la imagen en un thumbnail JPEG en base64.
+# Los JPEG se decodifican directamente a escala reducida con draft(), lo que evita
+# cargar la foto completa en memoria antes de achicarla.
+def make_thumbnail(data: bytes, size: Tuple[int, int] = THUMBNAIL_SIZE, quality: int = 85) -> str:
+    image = Image.open(io.BytesIO(data))
+
+    if image.format == 'JPEG':
+        image.draft('RGB', size)
+    
+    if image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[3])
+        image = background
+    elif image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+    
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
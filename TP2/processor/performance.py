@@ -1,22 +1,49 @@
 import time
-from urllib.parse import urljoin
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urljoin, urlparse
 import requests
-from typing import Dict
+from typing import Dict, Optional
 from bs4 import BeautifulSoup
 from common.errors import ProcessingError
+from processor.http_session import get_session
 
 
-# Analiza el rendimiento de la página
-def analyze_performance(url: str, timeout: int = 30) -> Dict[str, any]:
+RESOURCE_WORKERS = 16
+RESOURCE_LIMIT_PER_HOST = 6
+RESOURCE_BUDGET = 20  # segundos para medir todos los recursos
+MAX_RESOURCE_SIZE = 5 * 1024 * 1024
+
+
+# Analiza el rendimiento de la página.
+# Si se recibe el html ya descargado por el servidor de scraping (con el tiempo que tardo
+# esa descarga), no se vuelve a descargar la pagina y solo se analizan sus recursos.
+# Los recursos se miden en paralelo dentro de un presupuesto de budget segundos.
+def analyze_performance(url: str, timeout: int = 30, html: Optional[str] = None,
+                        load_time_ms: Optional[float] = None, base_url: Optional[str] = None,
+                        budget: float = RESOURCE_BUDGET) -> Dict[str, any]:
     max_size_html = 5 * 1024 * 1024  # 5MB
     retries=3
     delay=1
 
+    if html is not None:
+        try:
+            html_size = len(html.encode('utf-8'))
+            if html_size > max_size_html:
+                raise ProcessingError(
+                    f"La página {url} excede el tamaño máximo permitido de {max_size_html / (1024*1024)} MB"
+                )
+            return _performance_summary(html, html_size, load_time_ms or 0, base_url or url, budget)
+        except ProcessingError:
+            raise
+        except Exception as e:
+            raise ProcessingError(f"Error inesperado al analizar rendimiento: {e}")
+
     for attempt in range(retries):
         try:
             start_time = time.time()
             
-            response = requests.get(
+            response = get_session().get(
                 url,
                 timeout=timeout,
                 headers={'User-Agent': 'Mozilla/5.0 Web Scraper Bot'}
@@ -34,17 +61,7 @@ def analyze_performance(url: str, timeout: int = 30) -> Dict[str, any]:
                     f"La página {url} excede el tamaño máximo permitido de {max_size_html / (1024*1024)} MB"
                 )
             
-            html = BeautifulSoup(response.text, 'lxml')
-            
-            resources = analyze_resources(html,url)
-            
-            total_size = html_size + resources['total_size']
-            
-            return {
-                'load_time_ms': round(load_time, 2),
-                'total_size_kb': round(total_size / 1024, 3),
-                'num_requests': 1 + resources['count'],
-            }
+            return _performance_summary(response.text, html_size, load_time, url, budget)
         
         except requests.RequestException as e:
             if attempt < retries - 1:
@@ -57,11 +74,35 @@ def analyze_performance(url: str, timeout: int = 30) -> Dict[str, any]:
             raise ProcessingError(f"Error inesperado al analizar rendimiento: {e}")
 
 
-# Analiza los recursos de la página
-def analyze_resources(html: BeautifulSoup, base_url: str) -> Dict[str, any]:
+# Arma el resumen de rendimiento a partir del html y el tiempo de carga.
+# 'partial' indica que el presupuesto se agoto antes de medir todos los recursos.
+def _performance_summary(html_text: str, html_size: int, load_time: float, base_url: str,
+                         budget: float = RESOURCE_BUDGET) -> Dict[str, any]:
+    html = BeautifulSoup(html_text, 'lxml')
+    
+    resources = analyze_resources(html, base_url, budget)
+    
+    total_size = html_size + resources['total_size']
+    
+    return {
+        'load_time_ms': round(load_time, 2),
+        'total_size_kb': round(total_size / 1024, 3),
+        'num_requests': 1 + resources['count'],
+        'resources_measured': resources['measured'],
+        'partial': resources['partial'],
+    }
+
+
+# Analiza los recursos de la página.
+# Los tamaños se consultan en paralelo sobre una sesion con pool de conexiones, con un
+# maximo de RESOURCE_LIMIT_PER_HOST requests a la vez por host. Si se agota el presupuesto
+# se devuelve lo medido hasta ese momento con 'partial' en True.
+def analyze_resources(html: BeautifulSoup, base_url: str, budget: float = RESOURCE_BUDGET) -> Dict[str, any]:
     resources = {
         'count': 0,
-        'total_size': 0
+        'total_size': 0,
+        'measured': 0,
+        'partial': False
     }
 
     resource_urls = set()
@@ -80,23 +121,68 @@ def analyze_resources(html: BeautifulSoup, base_url: str) -> Dict[str, any]:
         if 'font' in href or tag.get('type', '').startswith('font/'):
             resource_urls.add(urljoin(base_url, tag['href']))
 
-    for res_url in resource_urls:
-        resources['count'] += 1
-        try:
-            head = requests.head(res_url, timeout=5, allow_redirects=True)
-            size = int(head.headers.get('Content-Length', 0))
-
-            if size == 0 or size==None:
-                get_resp = requests.get(res_url, timeout=10, stream=True)
-                size = 0
+    resources['count'] = len(resource_urls)
+    if not resource_urls:
+        return resources
+
+    deadline = time.monotonic() + budget
+    host_limits = {}
+    session = get_session()
+
+    executor = ThreadPoolExecutor(max_workers=min(RESOURCE_WORKERS, len(resource_urls)))
+    try:
+        futures = []
+        for res_url in resource_urls:
+            host = urlparse(res_url).netloc
+            if host not in host_limits:
+                host_limits[host] = threading.BoundedSemaphore(RESOURCE_LIMIT_PER_HOST)
+            futures.append(executor.submit(_resource_size, session, res_url, host_limits[host], deadline))
+
+        done, pending = wait(futures, timeout=budget)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    for future in done:
+        size = future.result()
+        if size is not None:
+            resources['total_size'] += size
+            resources['measured'] += 1
+
+    # Las consultas cortadas por el presupuesto terminan en None cerca del deadline
+    resources['partial'] = bool(pending) or time.monotonic() >= deadline
+    return resources
+
+
+# Devuelve el tamaño de un recurso: el Content-Length del HEAD o, si no lo tiene, lo que
+# se lee con un GET por partes (hasta MAX_RESOURCE_SIZE). None si fallo o no hubo tiempo.
+# La espera por el limite del host y los timeouts de cada request se acotan a lo que queda
+# del presupuesto, asi ninguna consulta sigue corriendo despues de que vence.
+def _resource_size(session: requests.Session, res_url: str, host_limit: threading.BoundedSemaphore,
+                   deadline: float) -> Optional[int]:
+    if not host_limit.acquire(timeout=max(0.0, deadline - time.monotonic())):
+        return None
+    try:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+
+        head = session.head(res_url, timeout=min(5, remaining), allow_redirects=True)
+        size = int(head.headers.get('Content-Length') or 0)
+
+        if size == 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with session.get(res_url, timeout=min(10, remaining), stream=True) as get_resp:
                 for chunk in get_resp.iter_content(chunk_size=51200):
                     size += len(chunk)
-                    if size > 5 * 1024 * 1024:
+                    if size > MAX_RESOURCE_SIZE or time.monotonic() >= deadline:
                         break
 
-            resources['total_size'] += size
+        return size
 
-        except Exception:
-            continue
+    except Exception:
+        return None
 
-    return resources
\ No newline at end of file
+    finally:
+        host_limit.release()
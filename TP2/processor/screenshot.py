@@ -1,9 +1,118 @@
 import base64
 import time
+import psutil
+from multiprocessing.util import Finalize
+from typing import Dict, Optional
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
 from common.errors import ProcessingError
 
 
+# Navegadores Chromium de larga duracion dentro de un proceso worker. Cada screenshot
+# usa un contexto nuevo sobre un navegador ya abierto, en lugar de lanzar uno por llamada.
+# Un navegador se recicla tras max_pages paginas o si la memoria de los procesos del
+# navegador supera max_memory_mb.
+class BrowserPool:
+
+    def __init__(self, size: int = 1, max_pages: int = 50, max_memory_mb: Optional[int] = 1024):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.playwright = None
+        self.browsers = []
+        self.next = 0
+
+    # Inicia playwright y lanza los navegadores
+    def start(self):
+        if self.playwright is None:
+            self.playwright = sync_playwright().start()
+        while len(self.browsers) < self.size:
+            self.browsers.append(self._launch())
+
+    # Devuelve un navegador listo para usar, reciclandolo antes si corresponde
+    def acquire(self) -> Dict:
+        self.start()
+
+        index = self.next
+        self.next = (self.next + 1) % self.size
+        entry = self.browsers[index]
+
+        if not entry['browser'].is_connected():
+            print("[BROWSER] Navegador desconectado, se relanza")
+            entry = self._replace(index)
+        elif entry['pages'] >= self.max_pages:
+            print(f"[BROWSER] Reciclando navegador tras {entry['pages']} páginas")
+            entry = self._replace(index)
+        elif self._over_memory_limit():
+            print(f"[BROWSER] Reciclando navegadores, memoria sobre {self.max_memory_mb} MB")
+            for i in range(len(self.browsers)):
+                self._replace(i)
+            entry = self.browsers[index]
+
+        entry['pages'] += 1
+        return entry
+
+    def close(self):
+        for entry in self.browsers:
+            self._close_browser(entry)
+        self.browsers = []
+        if self.playwright is not None:
+            self.playwright.stop()
+            self.playwright = None
+
+    def _launch(self) -> Dict:
+        browser = self.playwright.chromium.launch(
+            headless=True,
+            args=['--no-sandbox', '--disable-setuid-sandbox']
+        )
+        return {'browser': browser, 'pages': 0}
+
+    def _replace(self, index: int) -> Dict:
+        self._close_browser(self.browsers[index])
+        self.browsers[index] = self._launch()
+        return self.browsers[index]
+
+    def _close_browser(self, entry: Dict):
+        try:
+            entry['browser'].close()
+        except Exception:
+            pass
+
+    # Memoria (RSS) de los procesos hijos del worker: driver de playwright y Chromium
+    def _over_memory_limit(self) -> bool:
+        if not self.max_memory_mb:
+            return False
+        try:
+            children = psutil.Process().children(recursive=True)
+            rss = sum(child.memory_info().rss for child in children)
+        except psutil.Error:
+            return False
+        return rss > self.max_memory_mb * 1024 * 1024
+
+
+_browser_pool: Optional[BrowserPool] = None
+
+
+# Configura y precalienta los navegadores del proceso; se usa como initializer del Pool.
+# Los navegadores se cierran con un Finalize de multiprocessing: a diferencia de atexit,
+# tambien se ejecuta cuando termina un proceso hijo del pool.
+def init_browser_pool(size: int = 1, max_pages: int = 50, max_memory_mb: Optional[int] = 1024,
+                      warmup: bool = True):
+    global _browser_pool
+    _browser_pool = BrowserPool(size, max_pages, max_memory_mb)
+    Finalize(_browser_pool, _browser_pool.close, exitpriority=10)
+    if warmup:
+        try:
+            _browser_pool.start()
+        except Exception as e:
+            print(f"[WARN] No se pudo precalentar el navegador: {e}")
+
+
+def get_browser_pool() -> BrowserPool:
+    if _browser_pool is None:
+        init_browser_pool(warmup=False)
+    return _browser_pool
+
+
 # Genera un screenshot de la página web
 def generate_screenshot(
     url: str,
@@ -19,53 +128,152 @@ def generate_screenshot(
 
     for attempt in range(retries):
         try:
-            with sync_playwright() as p:
-                browser = p.chromium.launch(
-                    headless=True,
-                    args=['--no-sandbox', '--disable-setuid-sandbox']
-                )
-                
-                context = browser.new_context(
-                    viewport={'width': width, 'height': height},
-                    user_agent='Mozilla/5.0 Web Scraper Bot'
-                )
-                
-                page = context.new_page()
-                
-                try:
-                    page.goto(url, timeout=timeout, wait_until='networkidle')
-                except PlaywrightTimeout:
-                    page.goto(url, timeout=timeout, wait_until='domcontentloaded')
-                
-                screenshot_bytes = page.screenshot(
-                    full_page=full_page,
-                    type='png'
-                )
+            browser = get_browser_pool().acquire()['browser']
 
-                screenshot_size_mb = len(screenshot_bytes) / (1024 * 1024)
-                if screenshot_size_mb > max_size_mb:
-                    if full_page:
-                        screenshot_bytes = page.screenshot(full_page=False, type='png')
-                        screenshot_size_mb = len(screenshot_bytes) / (1024 * 1024)
-                        if screenshot_size_mb > max_size_mb:
-                            raise ProcessingError(
-                                f"El screenshot reducido de {url} excede el límite de {max_size_mb} MB "
-                                f"({screenshot_size_mb:.2f} MB)"
-                            )
-                    else:
-                        raise ProcessingError(
-                            f"El screenshot de {url} excede el límite de {max_size_mb} MB "
-                            f"({screenshot_size_mb:.2f} MB reales)"
-                        )
-                
+            context = browser.new_context(
+                viewport={'width': width, 'height': height},
+                user_agent='Mozilla/5.0 Web Scraper Bot'
+            )
+
+            try:
+                page = context.new_page()
+                _navigate(page, url, timeout)
+                screenshot_bytes = _take_screenshot(page, url, full_page, max_size_mb)
+            finally:
                 context.close()
-                browser.close()
                 
-                return base64.b64encode(screenshot_bytes).decode('utf-8')
+            return base64.b64encode(screenshot_bytes).decode('utf-8')
         
         except Exception as e:
             if attempt < retries - 1:
                 print(f"[WARN] Error generando screenshot de {url} (intento {attempt+1}/{retries}), reintentando...")
                 time.sleep(delay)
             else:
-                raise ProcessingError(f"Error al generar screenshot de {url} tras {retries} intentos. ERROR: {e}")
\ No newline at end of file
+                raise ProcessingError(f"Error al generar screenshot de {url} tras {retries} intentos. ERROR: {e}")
+
+
+# Toma el screenshot y mide el rendimiento con una sola navegacion del navegador.
+# El rendimiento sale de los eventos de red: tamaño transferido y tiempo de cada recurso.
+def capture_page(
+    url: str,
+    full_page: bool = True,
+    width: int = 1280,
+    height: int = 720,
+    timeout: int = 30000,
+    max_size_mb: int = 5
+) -> Dict[str, any]:
+
+    retries = 3
+    delay = 1
+
+    for attempt in range(retries):
+        try:
+            browser = get_browser_pool().acquire()['browser']
+
+            context = browser.new_context(
+                viewport={'width': width, 'height': height},
+                user_agent='Mozilla/5.0 Web Scraper Bot'
+            )
+
+            try:
+                page = context.new_page()
+                finished = []
+                failed = []
+                page.on('requestfinished', finished.append)
+                page.on('requestfailed', failed.append)
+
+                start_time = time.time()
+                _navigate(page, url, timeout, on_retry=lambda: (finished.clear(), failed.clear()))
+                elapsed_ms = (time.time() - start_time) * 1000
+
+                screenshot_bytes = _take_screenshot(page, url, full_page, max_size_mb)
+                performance = _network_performance(page, finished, failed, elapsed_ms)
+            finally:
+                context.close()
+
+            return {
+                'screenshot': base64.b64encode(screenshot_bytes).decode('utf-8'),
+                'performance': performance
+            }
+
+        except Exception as e:
+            if attempt < retries - 1:
+                print(f"[WARN] Error capturando {url} (intento {attempt+1}/{retries}), reintentando...")
+                time.sleep(delay)
+            else:
+                raise ProcessingError(f"Error al capturar {url} tras {retries} intentos. ERROR: {e}")
+
+
+# Navega a la pagina esperando que la red quede inactiva, o solo el DOM si eso no ocurre a tiempo
+def _navigate(page, url: str, timeout: int, on_retry=None):
+    try:
+        page.goto(url, timeout=timeout, wait_until='networkidle')
+    except PlaywrightTimeout:
+        if on_retry:
+            on_retry()
+        page.goto(url, timeout=timeout, wait_until='domcontentloaded')
+
+
+# Toma el screenshot respetando el tamaño maximo; si la pagina completa es muy grande usa el viewport
+def _take_screenshot(page, url: str, full_page: bool, max_size_mb: int) -> bytes:
+    screenshot_bytes = page.screenshot(
+        full_page=full_page,
+        type='png'
+    )
+
+    screenshot_size_mb = len(screenshot_bytes) / (1024 * 1024)
+    if screenshot_size_mb > max_size_mb:
+        if full_page:
+            screenshot_bytes = page.screenshot(full_page=False, type='png')
+            screenshot_size_mb = len(screenshot_bytes) / (1024 * 1024)
+            if screenshot_size_mb > max_size_mb:
+                raise ProcessingError(
+                    f"El screenshot reducido de {url} excede el límite de {max_size_mb} MB "
+                    f"({screenshot_size_mb:.2f} MB)"
+                )
+        else:
+            raise ProcessingError(
+                f"El screenshot de {url} excede el límite de {max_size_mb} MB "
+                f"({screenshot_size_mb:.2f} MB reales)"
+            )
+
+    return screenshot_bytes
+
+
+# Resume el rendimiento a partir de las requests que hizo el navegador
+def _network_performance(page, finished: list, failed: list, elapsed_ms: float) -> Dict[str, any]:
+    resources = []
+    total_size = 0
+
+    for request in finished:
+        # Tamaño transferido: cuerpo y headers de la respuesta
+        try:
+            sizes = request.sizes()
+            size = max(sizes['responseBodySize'], 0) + max(sizes['responseHeadersSize'], 0)
+        except Exception:
+            size = 0
+        timing = request.timing
+        duration = timing.get('responseEnd', -1)
+
+        resources.append({
+            'url': request.url,
+            'type': request.resource_type,
+            'size': size,
+            'duration_ms': round(duration, 2) if duration >= 0 else None
+        })
+        total_size += size
+
+    navigation = page.evaluate(
+        "() => { const n = performance.getEntriesByType('navigation')[0]; return n ? n.toJSON() : null; }"
+    )
+    if navigation and navigation.get('loadEventEnd', 0) > 0:
+        load_time = navigation['loadEventEnd']
+    else:
+        load_time = elapsed_ms
+
+    return {
+        'load_time_ms': round(load_time, 2),
+        'total_size_kb': round(total_size / 1024, 3),
+        'num_requests': len(finished) + len(failed),
+        'resources': resources
+    }
@@ -0,0 +1,47 @@
+import base64
+import os
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+
+SPOOL_KEY = '__spool__'
+
+
+# Ejecuta una tarea en el proceso worker y escribe sus artefactos (screenshot y thumbnails,
+# que las tareas devuelven en base64) como archivos en directory. El resultado que vuelve al
+# servidor lleva en su lugar {'__spool__': ruta, 'size': bytes}, asi el proceso principal
+# nunca recibe ni decodifica los artefactos: los envia en streaming leyendo el archivo.
+def run_spooled(directory: str, name: str, func: Callable, args: tuple, kwargs: Dict) -> Any:
+    value = func(*args, **kwargs)
+
+    if name == 'screenshot':
+        return spool_artifact(value, directory)
+
+    if name == 'capture':
+        value['screenshot'] = spool_artifact(value['screenshot'], directory)
+
+    elif name == 'thumbnails':
+        for thumbnail in value:
+            if thumbnail.get('thumbnail_base64'):
+                thumbnail['thumbnail_base64'] = spool_artifact(thumbnail['thumbnail_base64'], directory)
+
+    return value
+
+
+# Decodifica un artefacto en base64 y lo escribe en un archivo nuevo de directory
+def spool_artifact(value: Any, directory: str) -> Any:
+    if not isinstance(value, str):
+        return value
+
+    data = base64.b64decode(value)
+    path = os.path.join(directory, uuid.uuid4().hex)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return {SPOOL_KEY: path, 'size': len(data)}
+
+
+# Devuelve (ruta, tamaño) si el valor es un artefacto escrito por run_spooled
+def spooled(value: Any) -> Optional[tuple]:
+    if isinstance(value, dict) and set(value) == {SPOOL_KEY, 'size'}:
+        return value[SPOOL_KEY], value['size']
+    return None
@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.util import Finalize
+from typing import Dict, Optional, Tuple
+
+
+# Cache de thumbnails de un proceso worker, direccionada por contenido.
+# Guarda dos indices: URL de la imagen -> hash del contenido descargado (o el error si la
+# URL no es una imagen soportada, cache negativa) y hash -> thumbnail. Asi una imagen
+# repetida en otra URL tampoco se vuelve a decodificar. Los thumbnails viven en memoria
+# (LRU hasta max_bytes) y al ser desalojados pasan a un SQLite en 'directory' compartido
+# por todos los procesos, donde tambien se escriben los indices de URL.
+class ThumbnailCache:
+
+    MAX_URLS = 10000
+    DISK_MAX_THUMBNAILS = 50000
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, directory: Optional[str] = None,
+                 url_ttl: int = 3600):
+        self.max_bytes = max_bytes
+        self.url_ttl = url_ttl
+        self.thumbnails = OrderedDict()
+        self.urls = OrderedDict()
+        self.size = 0
+        self.spills = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'negative_hits': 0, 'misses': 0}
+
+        self.db = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.db = sqlite3.connect(
+                os.path.join(directory, 'thumbnails.db'), timeout=10, check_same_thread=False
+            )
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS urls ('
+                'key TEXT PRIMARY KEY, hash TEXT, error TEXT, timestamp REAL NOT NULL)'
+            )
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS thumbnails ('
+                'hash TEXT PRIMARY KEY, data TEXT NOT NULL, timestamp REAL NOT NULL)'
+            )
+            self.db.execute('DELETE FROM urls WHERE timestamp <= ?', (time.time() - url_ttl,))
+            self.db.commit()
+
+    # Devuelve (hash, error) de la URL si se conoce y no vencio
+    def get_url(self, key: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        with self.lock:
+            entry = self.urls.get(key)
+            if entry is None and self.db is not None:
+                row = self.db.execute(
+                    'SELECT hash, error, timestamp FROM urls WHERE key = ?', (key,)
+                ).fetchone()
+                if row:
+                    entry = row
+                    self._remember_url(key, entry)
+
+            if entry is None or time.time() - entry[2] >= self.url_ttl:
+                self.stats['misses'] += 1
+                return None
+
+            if entry[1] is not None:
+                self.stats['negative_hits'] += 1
+            return entry[0], entry[1]
+
+    def set_url(self, key: str, content_hash: Optional[str] = None, error: Optional[str] = None):
+        entry = (content_hash, error, time.time())
+        with self.lock:
+            self._remember_url(key, entry)
+            if self.db is not None:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO urls (key, hash, error, timestamp) VALUES (?, ?, ?, ?)',
+                    (key, *entry)
+                )
+                self.db.commit()
+
+    # Devuelve el thumbnail del hash desde memoria o, si fue desalojado, desde disco
+    def get_thumbnail(self, content_hash: str) -> Optional[str]:
+        with self.lock:
+            thumbnail = self.thumbnails.get(content_hash)
+            if thumbnail is not None:
+                self.thumbnails.move_to_end(content_hash)
+                self.stats['hits'] += 1
+                return thumbnail
+
+            if self.db is not None:
+                row = self.db.execute(
+                    'SELECT data FROM thumbnails WHERE hash = ?', (content_hash,)
+                ).fetchone()
+                if row:
+                    self.stats['disk_hits'] += 1
+                    self._store(content_hash, row[0])
+                    return row[0]
+
+            self.stats['misses'] += 1
+            return None
+
+    def set_thumbnail(self, content_hash: str, thumbnail: str):
+        with self.lock:
+            if content_hash not in self.thumbnails:
+                self._store(content_hash, thumbnail)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {**self.stats, 'entries': len(self.thumbnails), 'size_bytes': self.size}
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self._spill(list(self.thumbnails.items()))
+                self.db.close()
+                self.db = None
+
+    def _remember_url(self, key: str, entry: tuple):
+        self.urls[key] = entry
+        self.urls.move_to_end(key)
+        while len(self.urls) > self.MAX_URLS:
+            self.urls.popitem(last=False)
+
+    # Agrega a memoria desalojando los menos usados; los desalojados pasan a disco
+    def _store(self, content_hash: str, thumbnail: str):
+        self.thumbnails[content_hash] = thumbnail
+        self.size += len(thumbnail)
+
+        evicted = []
+        while self.size > self.max_bytes and len(self.thumbnails) > 1:
+            old_hash, old_thumbnail = self.thumbnails.popitem(last=False)
+            self.size -= len(old_thumbnail)
+            evicted.append((old_hash, old_thumbnail))
+
+        if evicted and self.db is not None:
+            self._spill(evicted)
+
+    def _spill(self, entries: list):
+        now = time.time()
+        self.db.executemany(
+            'INSERT OR IGNORE INTO thumbnails (hash, data, timestamp) VALUES (?, ?, ?)',
+            [(content_hash, thumbnail, now) for content_hash, thumbnail in entries]
+        )
+        self.spills += len(entries)
+        if self.spills >= 1000:
+            self.spills = 0
+            self.db.execute(
+                'DELETE FROM thumbnails WHERE hash NOT IN '
+                '(SELECT hash FROM thumbnails ORDER BY timestamp DESC LIMIT ?)',
+                (self.DISK_MAX_THUMBNAILS,)
+            )
+        self.db.commit()
+
+
+_thumbnail_cache = None
+
+
+# Inicializa la cache de thumbnails del proceso worker (initializer del Pool). Al terminar
+# el proceso (Finalize, que a diferencia de atexit corre en los hijos del pool) los
+# thumbnails en memoria pasan al SQLite y se cierra la conexion.
+def init_thumbnail_cache(max_mb: int = 32, directory: Optional[str] = None, url_ttl: int = 3600):
+    global _thumbnail_cache
+    if max_mb <= 0:
+        _thumbnail_cache = None
+        return
+    _thumbnail_cache = ThumbnailCache(max_mb * 1024 * 1024, directory, url_ttl)
+    Finalize(_thumbnail_cache, _thumbnail_cache.close, exitpriority=10)
+
+
+def get_thumbnail_cache() -> Optional[ThumbnailCache]:
+    return _thumbnail_cache
@@ -0,0 +1,477 @@
+import multiprocessing
+import signal
+import threading
+import time
+import psutil
+from typing import Any, Callable, Dict, Optional
+from common.errors import ProcessingError, PoolFullError, TaskCancelledError, TimeoutError
+from processor.fair_queue import FairQueue, DEFAULT_PRIORITY
+
+
+# Tarea enviada al pool. Tiene un deadline: si vence antes de empezar se descarta sin
+# ejecutarse y si vence (o se cancela) mientras corre, el proceso que la ejecuta se mata
+# y se reemplaza por uno nuevo. Expone get/ready como el AsyncResult de multiprocessing.
+class Job:
+
+    def __init__(self, func: Callable, args: tuple, kwargs: Dict, deadline: Optional[float] = None,
+                 callback: Optional[Callable] = None, error_callback: Optional[Callable] = None):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.callback = callback
+        self.error_callback = error_callback
+        self.cancelled = False
+        self.value = None
+        self.error = None
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def ready(self) -> bool:
+        return self.event.is_set()
+
+    # Espera el resultado; por defecto hasta el deadline de la tarea
+    def get(self, timeout: Optional[float] = None) -> Any:
+        if not self.event.wait(self.remaining() if timeout is None else timeout):
+            raise TimeoutError("La tarea no terminó a tiempo")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    # Cancela la tarea: si esta en cola no llega a ejecutarse, si esta corriendo se mata su proceso
+    def cancel(self):
+        self.cancelled = True
+        self.finish(error=TaskCancelledError("Tarea cancelada"))
+
+    # Completa la tarea una sola vez; devuelve False si ya estaba completa
+    def finish(self, value: Any = None, error: Optional[Exception] = None) -> bool:
+        with self.lock:
+            if self.event.is_set():
+                return False
+            self.value = value
+            self.error = error
+            self.event.set()
+
+        try:
+            if error is None:
+                if self.callback:
+                    self.callback(value)
+            elif self.error_callback:
+                self.error_callback(error)
+        except Exception as e:
+            print(f"[WARN] Error en callback de tarea: {e}")
+        return True
+
+
+# Pool de procesos con deadlines y cancelacion real. Cada proceso tiene una thread que lo
+# alimenta desde la cola comun y vigila la tarea en curso; a diferencia de multiprocessing.Pool,
+# un proceso ocupado con una tarea abandonada se puede matar (junto a sus hijos, ej. Chromium)
+# sin afectar al resto.
+# Con max_queue se rechazan tareas (PoolFullError) si ya hay tantas esperando, y con
+# maxtasksperchild cada proceso se recicla despues de ejecutar esa cantidad de tareas.
+# Las tareas esperan en una FairQueue: por prioridad y con reparto justo entre flujos,
+# con los pesos por flujo de weights.
+# Con min_processes menor a processes el pool es elastico: arranca con min_processes y una
+# thread agrega procesos (hasta processes) cuando las tareas esperan mas de scale_up_wait
+# segundos y hay margen de CPU y memoria, y los quita cuando sobran durante scale_down_idle.
+# Con max_rss_mb un proceso cuya memoria (con sus hijos) la supera se recicla al terminar su tarea.
+class WorkerPool:
+
+    poll_interval = 0.1
+    scale_interval = 1.0
+
+    def __init__(self, processes: int, initializer: Optional[Callable] = None, initargs: tuple = (),
+                 name: str = 'pool', max_queue: int = 0, maxtasksperchild: Optional[int] = None,
+                 weights: Optional[Dict[str, float]] = None, min_processes: Optional[int] = None,
+                 scale_up_wait: float = 1.0, scale_down_idle: float = 30.0, cpu_limit: float = 85.0,
+                 min_free_memory_mb: int = 512, max_rss_mb: Optional[int] = None):
+        self.name = name
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_queue = max_queue
+        self.maxtasksperchild = maxtasksperchild
+        self.max_processes = processes
+        self.min_processes = min(min_processes, processes) if min_processes else processes
+        self.scale_up_wait = scale_up_wait
+        self.scale_down_idle = scale_down_idle
+        self.cpu_limit = cpu_limit
+        self.min_free_memory_mb = min_free_memory_mb
+        self.max_rss_mb = max_rss_mb
+        self.queue = FairQueue(weights)
+        self.closed = False
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.busy_seconds = 0.0
+        self.retired_seconds = 0.0
+        self.avg_wait = 0.0
+        self.last_dequeue = time.monotonic()
+        self.idle_since = None
+        self.started = time.monotonic()
+        self.stats = {
+            'submitted': 0, 'completed': 0, 'failed': 0, 'expired': 0, 'cancelled': 0,
+            'killed': 0, 'rejected': 0, 'recycled': 0, 'rss_recycled': 0,
+            'scaled_up': 0, 'scaled_down': 0
+        }
+        self.workers = []
+        for _ in range(self.min_processes):
+            self._add_worker()
+
+        if self.elastic:
+            psutil.cpu_percent(interval=None)
+            threading.Thread(target=self._autoscale, daemon=True).start()
+
+    @property
+    def elastic(self) -> bool:
+        return self.min_processes < self.max_processes
+
+    def apply_async(self, func: Callable, args: tuple = (), kwds: Optional[Dict] = None,
+                    callback: Optional[Callable] = None, error_callback: Optional[Callable] = None,
+                    deadline: Optional[float] = None, priority: str = DEFAULT_PRIORITY,
+                    flow: Optional[str] = None) -> Job:
+        if self.closed:
+            raise ProcessingError("El pool de procesos está cerrado")
+
+        if self.max_queue and self.queue.qsize() >= self.max_queue:
+            self._count('rejected')
+            raise PoolFullError(f"El pool '{self.name}' tiene {self.max_queue} tareas en cola")
+
+        job = Job(func, args, kwds or {}, deadline, callback, error_callback)
+        job.queued_at = time.monotonic()
+        self._count('submitted')
+        self.queue.put(job, priority, flow)
+        return job
+
+    # Estadisticas del pool. 'utilization' es la fraccion del tiempo de proceso disponible
+    # desde el inicio que estuvo ocupada con tareas; 'busy' la cantidad ocupada ahora.
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            now = time.monotonic()
+            busy_seconds = self.busy_seconds + sum(
+                now - worker.busy_since for worker in self.workers if worker.busy_since is not None
+            )
+            capacity = self.retired_seconds + sum(now - worker.added_at for worker in self.workers)
+            return {
+                **self.stats,
+                'processes': len(self.workers),
+                'min_processes': self.min_processes,
+                'max_processes': self.max_processes,
+                'avg_wait_ms': round(self.avg_wait * 1000, 2),
+                'busy': self.busy,
+                'queued': self.queue.qsize(),
+                'queued_by_priority': self.queue.sizes(),
+                'max_queue': self.max_queue,
+                'utilization': round(busy_seconds / capacity, 3) if capacity > 0 else 0.0
+            }
+
+    # No acepta nuevas tareas; las encoladas se terminan de ejecutar
+    def close(self):
+        self.closed = True
+        for _ in list(self.workers):
+            self.queue.put(None)
+
+    # Mata todos los procesos sin esperar las tareas en curso
+    def terminate(self):
+        self.closed = True
+        workers = list(self.workers)
+        for worker in workers:
+            worker.stopped = True
+            worker.kill()
+        for _ in workers:
+            self.queue.put(None)
+
+    def join(self):
+        for worker in list(self.workers):
+            worker.thread.join()
+
+    def _count(self, stat: str, delta: int = 1):
+        with self.lock:
+            self.stats[stat] += delta
+
+    def _add_worker(self):
+        worker = _Worker(self)
+        with self.lock:
+            self.workers.append(worker)
+        worker.start()
+
+    def _remove_worker(self, worker: '_Worker'):
+        with self.lock:
+            if worker in self.workers:
+                self.workers.remove(worker)
+                self.retired_seconds += time.monotonic() - worker.added_at
+
+    # Promedio movil del tiempo que esperan las tareas en la cola
+    def _record_wait(self, job: Job):
+        now = time.monotonic()
+        with self.lock:
+            self.avg_wait = 0.7 * self.avg_wait + 0.3 * (now - job.queued_at)
+            self.last_dequeue = now
+
+    # Hay margen para un proceso mas si la CPU y la memoria libre no estan al limite
+    def _has_headroom(self) -> bool:
+        cpu = psutil.cpu_percent(interval=None)
+        free_mb = psutil.virtual_memory().available / (1024 * 1024)
+        return cpu < self.cpu_limit and free_mb > self.min_free_memory_mb
+
+    # Agrega o quita procesos segun la espera de la cola y el margen del sistema
+    def _autoscale(self):
+        while not self.closed:
+            time.sleep(self.scale_interval)
+            if self.closed:
+                break
+
+            now = time.monotonic()
+            queued = self.queue.qsize()
+            with self.lock:
+                processes = len(self.workers)
+                busy = self.busy
+                if not queued:
+                    # Sin cola el promedio de espera se olvida de a poco
+                    self.avg_wait *= 0.5
+                waiting = max(self.avg_wait, now - self.last_dequeue if queued else 0.0)
+
+            if queued and busy >= processes and processes < self.max_processes:
+                self.idle_since = None
+                if waiting >= self.scale_up_wait and self._has_headroom():
+                    print(f"[POOL {self.name}] Tareas esperando {waiting:.1f}s, se agrega un proceso "
+                          f"({processes + 1}/{self.max_processes})")
+                    self._count('scaled_up')
+                    self._add_worker()
+                continue
+
+            if queued or busy >= processes or processes <= self.min_processes:
+                self.idle_since = None
+                continue
+
+            if self.idle_since is None:
+                self.idle_since = now
+            elif now - self.idle_since >= self.scale_down_idle:
+                print(f"[POOL {self.name}] Procesos ociosos, se quita uno ({processes - 1}/{self.max_processes})")
+                self._count('scaled_down')
+                self.idle_since = now
+                # Un None en la cola termina al primer proceso libre que lo tome
+                self.queue.put(None)
+
+
+# Proceso worker del pool junto a la thread que le envia tareas
+class _Worker:
+
+    def __init__(self, pool: WorkerPool):
+        self.pool = pool
+        self.process = None
+        self.conn = None
+        self.stopped = False
+        self.tasks = 0
+        self.busy_since = None
+        self.added_at = time.monotonic()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._spawn()
+        self.thread.start()
+
+    # Mata el proceso y todos sus hijos
+    def kill(self):
+        process = self.process
+        if process is None or not process.is_alive():
+            return
+
+        try:
+            children = psutil.Process(process.pid).children(recursive=True)
+        except psutil.Error:
+            children = []
+
+        process.kill()
+        for child in children:
+            try:
+                child.kill()
+            except psutil.Error:
+                pass
+        process.join()
+
+    def _spawn(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main,
+            args=(child_conn, self.pool.initializer, self.pool.initargs),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    def _replace(self):
+        self.kill()
+        self.conn.close()
+        self.tasks = 0
+        if not self.stopped:
+            self._spawn()
+
+    # Termina el proceso de forma ordenada y lo reemplaza
+    def _recycle(self):
+        self.pool._count('recycled')
+        self._stop()
+        self._replace()
+
+    # Pide al proceso que termine (sus Finalize cierran los navegadores) y mata lo que siga
+    # vivo: el proceso si no termino a tiempo y sus hijos (driver de playwright, Chromium)
+    # que hayan quedado huerfanos. Los hijos se obtienen antes, mientras el proceso existe.
+    def _stop(self):
+        process = self.process
+        if process is None or not process.is_alive():
+            return
+
+        try:
+            children = psutil.Process(process.pid).children(recursive=True)
+        except psutil.Error:
+            children = []
+
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        process.join(5)
+        self.kill()
+
+        for child in children:
+            try:
+                if child.is_running():
+                    child.kill()
+            except psutil.Error:
+                pass
+
+    def _run(self):
+        while True:
+            # No retener la ultima tarea (su resultado o su error) mientras se espera la proxima
+            job = None
+            job = self.pool.queue.get()
+            if job is None or self.stopped:
+                break
+
+            self.pool._record_wait(job)
+
+            if job.ready():
+                self.pool._count('cancelled')
+                continue
+
+            if job.expired():
+                self.pool._count('expired')
+                job.finish(error=TimeoutError("La tarea venció antes de empezar a ejecutarse"))
+                continue
+
+            with self.pool.lock:
+                self.pool.busy += 1
+                self.busy_since = time.monotonic()
+            try:
+                self._execute(job)
+            finally:
+                with self.pool.lock:
+                    self.pool.busy -= 1
+                    self.pool.busy_seconds += time.monotonic() - self.busy_since
+                    self.busy_since = None
+
+            self.tasks += 1
+            if self.pool.maxtasksperchild and self.tasks >= self.pool.maxtasksperchild:
+                self._recycle()
+            elif self.pool.max_rss_mb and self.rss_mb() > self.pool.max_rss_mb:
+                print(f"[POOL {self.pool.name}] El proceso {self.process.pid} supera "
+                      f"{self.pool.max_rss_mb} MB de memoria, se recicla")
+                self.pool._count('rss_recycled')
+                self._recycle()
+
+        self._stop()
+        self.pool._remove_worker(self)
+
+    # Memoria residente del proceso y sus hijos (ej. Chromium) en MB
+    def rss_mb(self) -> float:
+        try:
+            process = psutil.Process(self.process.pid)
+            processes = [process] + process.children(recursive=True)
+        except psutil.Error:
+            return 0.0
+
+        total = 0
+        for proc in processes:
+            try:
+                total += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / (1024 * 1024)
+
+    # Envia la tarea al proceso y espera el resultado vigilando deadline y cancelacion
+    def _execute(self, job: Job):
+        if not self.process.is_alive():
+            self._replace()
+
+        try:
+            self.conn.send((job.func, job.args, job.kwargs))
+        except Exception as e:
+            self.pool._count('failed')
+            job.finish(error=ProcessingError(f"No se pudo enviar la tarea al proceso: {e}"))
+            return
+
+        while True:
+            if self.conn.poll(self.pool.poll_interval):
+                try:
+                    ok, value = self.conn.recv()
+                except EOFError:
+                    ok, value = False, ProcessingError("El proceso terminó inesperadamente")
+                    self._replace()
+
+                if ok:
+                    self.pool._count('completed')
+                    job.finish(value)
+                else:
+                    self.pool._count('failed')
+                    job.finish(error=value)
+                return
+
+            if job.cancelled or job.expired():
+                self.pool._count('cancelled' if job.cancelled else 'expired')
+                self.pool._count('killed')
+                print(f"[WARN] Tarea {'cancelada' if job.cancelled else 'vencida'} en ejecución, "
+                      f"se reemplaza el proceso {self.process.pid}")
+                self._replace()
+                job.finish(error=TimeoutError("La tarea superó su deadline y fue cancelada"))
+                return
+
+            if not self.process.is_alive():
+                self.pool._count('failed')
+                self._replace()
+                job.finish(error=ProcessingError("El proceso terminó inesperadamente"))
+                return
+
+
+# Loop del proceso worker: inicializa y ejecuta tareas hasta recibir None
+def _worker_main(conn, initializer: Optional[Callable], initargs: tuple):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    if initializer:
+        initializer(*initargs)
+
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+
+        func, args, kwargs = task
+        try:
+            result = (True, func(*args, **kwargs))
+        except Exception as e:
+            result = (False, e)
+
+        try:
+            conn.send(result)
+        except Exception as e:
+            conn.send((False, ProcessingError(f"No se pudo devolver el resultado: {e}")))
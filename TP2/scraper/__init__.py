@@ -4,10 +4,17 @@ Módulo de scraping web asíncrono.
 
 from .html_parser import parse_html
 from .metadata_extractor import extract_metadata
-from .async_http import fetch_url
+from .page_analyzer import analyze_page, BACKENDS as PARSER_BACKENDS
+from .shared_html import SharedHTML, analyze_shared_page
+from .async_http import fetch_url, create_session
 
 __all__ = [
     'parse_html',
     'extract_metadata',
-    'fetch_url'
+    'analyze_page',
+    'PARSER_BACKENDS',
+    'SharedHTML',
+    'analyze_shared_page',
+    'fetch_url',
+    'create_session'
 ]
\ No newline at end of file
@@ -1,37 +1,61 @@
 import aiohttp
 import asyncio
+import codecs
+import re
+import time
 from typing import Dict, Optional
 from urllib.parse import urlparse
-from common.errors import ScrapingError, InvalidURLError
+from common.errors import ScrapingError, InvalidURLError, ContentTooLargeError
 
 
-# Realiza un fetch de la URL dada
-async def fetch_url(url: str, timeout: int = 30, retries: int = 3) -> Dict[str, any]:
+DEFAULT_MAX_BODY_SIZE = 5 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+_META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+# Crea una sesion HTTP de larga duracion con pool de conexiones keep-alive y cache de DNS.
+# Debe crearse dentro del event loop y cerrarse con 'await session.close()'.
+def create_session(limit: int = 100, limit_per_host: int = 8,
+                   keepalive_timeout: int = 30, dns_ttl: int = 300) -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+        use_dns_cache=True,
+        ttl_dns_cache=dns_ttl
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+# Realiza un fetch de la URL dada.
+# Si se pasan etag/last_modified la request es condicional y puede devolver status 304 sin html.
+# Si se pasa una session se reutilizan sus conexiones, sino se crea una sesion temporal.
+# El cuerpo se lee por partes y se corta con ContentTooLargeError al superar max_size bytes.
+async def fetch_url(url: str, timeout: int = 30, retries: int = 3,
+                    etag: Optional[str] = None, last_modified: Optional[str] = None,
+                    session: Optional[aiohttp.ClientSession] = None,
+                    max_size: int = DEFAULT_MAX_BODY_SIZE) -> Dict[str, any]:
 
     if not _is_valid_url(url):
         raise InvalidURLError(f"URL inválida: {url}")
     
+    headers = {'User-Agent': 'Mozilla/5.0 Web Scraper Bot'}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
     last_exception = None
     
     for attempt in range(retries):
         try:
             timeout_obj = aiohttp.ClientTimeout(total=timeout)
-            
-            async with aiohttp.ClientSession(timeout=timeout_obj) as session:
-                async with session.get(
-                    url,
-                    allow_redirects=True,
-                    headers={'User-Agent': 'Mozilla/5.0 Web Scraper Bot'}
-                ) as response:
-                    html = await response.text()
-                    
-                    return {
-                        'html': html,
-                        'status': response.status,
-                        'headers': dict(response.headers),
-                        'url_final': str(response.url),
-                        'content_type': response.headers.get('Content-Type', '')
-                    }
+
+            if session is not None:
+                return await _get(session, url, headers, timeout_obj, max_size)
+
+            async with aiohttp.ClientSession() as own_session:
+                return await _get(own_session, url, headers, timeout_obj, max_size)
         
         except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             last_exception = e
@@ -39,12 +63,95 @@ async def fetch_url(url: str, timeout: int = 30, retries: int = 3) -> Dict[str,
                     print("Reintentando en 1 segundo...")
                     await asyncio.sleep(1)
 
+        except ContentTooLargeError:
+            raise
+
         except Exception as e:
             raise ScrapingError(f"Error inesperado al acceder a {url}: {e}")
         
     raise ScrapingError(f"No se pudo acceder a {url} tras {retries} intentos. ERROR: {last_exception}")
 
 
+# Realiza el GET sobre la sesion dada y arma el resultado
+async def _get(session: aiohttp.ClientSession, url: str, headers: Dict[str, str],
+               timeout: aiohttp.ClientTimeout, max_size: int) -> Dict[str, any]:
+    start_time = time.time()
+
+    async with session.get(
+        url,
+        allow_redirects=True,
+        headers=headers,
+        timeout=timeout
+    ) as response:
+        if response.content_length and response.content_length > max_size:
+            raise ContentTooLargeError(
+                f"La página {url} excede el tamaño máximo permitido de {max_size / (1024*1024)} MB"
+            )
+
+        html = '' if response.status == 304 else await _read_text(response, url, max_size)
+        
+        return {
+            'html': html,
+            'status': response.status,
+            'headers': dict(response.headers),
+            'url_final': str(response.url),
+            'content_type': response.headers.get('Content-Type', ''),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'elapsed_ms': (time.time() - start_time) * 1000
+        }
+
+
+# Lee el cuerpo por partes decodificandolo de forma incremental, sin superar max_size bytes
+async def _read_text(response: aiohttp.ClientResponse, url: str, max_size: int) -> str:
+    decoder = None
+    parts = []
+    size = 0
+
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            raise ContentTooLargeError(
+                f"La página {url} excede el tamaño máximo permitido de {max_size / (1024*1024)} MB"
+            )
+
+        if decoder is None:
+            charset = _detect_charset(response.charset, chunk)
+            decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+
+        parts.append(decoder.decode(chunk))
+
+    if decoder is not None:
+        parts.append(decoder.decode(b'', final=True))
+
+    return ''.join(parts)
+
+
+# Detecta la codificacion: header Content-Type, BOM, <meta charset> o utf-8 por defecto
+def _detect_charset(header_charset: Optional[str], first_chunk: bytes) -> str:
+    candidates = [header_charset]
+
+    if first_chunk.startswith(codecs.BOM_UTF8):
+        candidates.insert(0, 'utf-8-sig')
+    elif first_chunk.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        candidates.insert(0, 'utf-16')
+
+    match = _META_CHARSET.search(first_chunk[:2048])
+    if match:
+        candidates.append(match.group(1).decode('ascii', 'ignore'))
+
+    for charset in candidates:
+        if not charset:
+            continue
+        try:
+            codecs.lookup(charset)
+            return charset
+        except LookupError:
+            continue
+
+    return 'utf-8'
+
+
 # Valida y corrige formato de la URL
 def _is_valid_url(url: str) -> bool:
     try:
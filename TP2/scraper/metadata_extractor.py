@@ -1,34 +1,7 @@
-from bs4 import BeautifulSoup
-from typing import Dict, Optional
+from typing import Dict
+from .page_analyzer import analyze_page
 
 
 # Extrae metadatos de la pagina
-def extract_metadata(html_content: str) -> Dict[str, any]:
-    html = BeautifulSoup(html_content, "lxml")
-
-    meta_tags = {}
-    meta_tags.update(_extract_basic_meta(html))
-    meta_tags.update(_extract_open_graph(html))
-
-    return meta_tags
-
-
-# Extrae metadatos descripciones y keywords de la pagina
-def _extract_basic_meta(html: BeautifulSoup) -> Dict[str, str]:
-    meta_info = {}
-    for name in ["description", "keywords"]:
-        tag = html.find("meta", attrs={"name": name})
-        if tag and tag.get("content"):
-            meta_info[name] = tag["content"].strip()
-    return meta_info
-
-
-# Extrae metadatos Open Graph de la pagina
-def _extract_open_graph(html: BeautifulSoup) -> Dict[str, str]:
-    og_info = {}
-    for tag in html.find_all("meta", attrs={"property": lambda x: x and x.startswith("og:")}):
-        prop = tag.get("property")
-        content = tag.get("content")
-        if prop and content:
-            og_info[prop] = content.strip()
-    return og_info
\ No newline at end of file
+def extract_metadata(html_content: str, backend: str = 'bs4') -> Dict[str, any]:
+    return analyze_page(html_content, backend=backend)['meta_tags']
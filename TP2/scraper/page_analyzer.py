@@ -0,0 +1,140 @@
+from bs4 import BeautifulSoup
+from lxml import etree
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from urllib.parse import urljoin
+
+
+HEADINGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+BASIC_META = ('description', 'keywords')
+BACKENDS = ('bs4', 'lxml')
+
+
+# Analiza el HTML en una sola pasada: titulo, links, estructura, imagenes y metadatos.
+# backend 'bs4' usa BeautifulSoup y 'lxml' recorre directamente el arbol de lxml
+# (mas rapido, con los mismos resultados).
+def analyze_page(html_content: str, base_url: str = '', backend: str = 'bs4') -> Dict:
+    if backend == 'lxml':
+        elements, string_of, text_of = _lxml_elements(html_content), _lxml_string, _lxml_text
+    elif backend == 'bs4':
+        elements, string_of, text_of = _bs4_elements(html_content), _bs4_string, _bs4_text
+    else:
+        raise ValueError(f"Backend de parseo invalido: {backend}")
+
+    title_tag = None
+    first_h1 = None
+    links = []
+    seen_links = set()
+    structure = {h: 0 for h in HEADINGS}
+    images_count = 0
+    basic_meta = {}
+    seen_meta = set()
+    og_meta = {}
+
+    for name, tag in elements:
+        if name == 'a':
+            _add_link(tag, base_url, links, seen_links)
+
+        elif name in structure:
+            structure[name] += 1
+            if name == 'h1' and first_h1 is None:
+                first_h1 = tag
+
+        elif name == 'img':
+            images_count += 1
+
+        elif name == 'title':
+            if title_tag is None:
+                title_tag = tag
+
+        elif name == 'meta':
+            _add_meta(tag, basic_meta, seen_meta, og_meta)
+
+    return {
+        'title': _title(title_tag, first_h1, string_of, text_of),
+        'links': links,
+        'structure': structure,
+        'images_count': images_count,
+        'meta_tags': {**basic_meta, **og_meta}
+    }
+
+
+# Obtiene el titulo desde <title> o, si no hay, desde el primer h1
+def _title(title_tag, first_h1, string_of: Callable, text_of: Callable) -> str:
+    title = string_of(title_tag) if title_tag is not None else None
+    if title:
+        return title.strip()
+
+    if first_h1 is not None:
+        return text_of(first_h1)
+
+    return "Sin título"
+
+
+# Agrega el link absoluto del tag <a> si es valido y no se repite
+def _add_link(tag, base_url: str, links: list, seen: set):
+    href = tag.get('href')
+    if href is None:
+        return
+
+    href = href.strip()
+    if not href or href.startswith('#') or href.startswith('javascript:'):
+        return
+
+    absolute_url = urljoin(base_url, href) if base_url else href
+
+    if absolute_url not in seen:
+        seen.add(absolute_url)
+        links.append(absolute_url)
+
+
+# Registra description/keywords (solo el primer tag de cada uno) y los Open Graph
+def _add_meta(tag, basic_meta: Dict, seen_meta: set, og_meta: Dict):
+    name = tag.get('name')
+    if name in BASIC_META and name not in seen_meta:
+        seen_meta.add(name)
+        if tag.get('content'):
+            basic_meta[name] = tag.get('content').strip()
+
+    prop = tag.get('property')
+    if prop and prop.startswith('og:'):
+        content = tag.get('content')
+        if content:
+            og_meta[prop] = content.strip()
+
+
+# Backend BeautifulSoup
+def _bs4_elements(html_content: str) -> Iterator[Tuple[str, object]]:
+    html = BeautifulSoup(html_content, 'lxml')
+    return ((tag.name, tag) for tag in html.find_all(True))
+
+
+def _bs4_string(tag) -> Optional[str]:
+    return tag.string
+
+
+def _bs4_text(tag) -> str:
+    return tag.get_text(strip=True)
+
+
+# Backend lxml: recorre el arbol de elementos sin construir el de BeautifulSoup
+def _lxml_elements(html_content: str) -> Iterator[Tuple[str, object]]:
+    parser = etree.HTMLParser(encoding='utf-8')
+    root = etree.fromstring(html_content.encode('utf-8'), parser)
+    if root is None:
+        return iter(())
+    # Se omiten comentarios e instrucciones de procesamiento (su tag no es un string)
+    return ((el.tag, el) for el in root.iter() if isinstance(el.tag, str))
+
+
+# Equivalente a Tag.string de BeautifulSoup: el unico texto del elemento, si lo hay
+def _lxml_string(el) -> Optional[str]:
+    if len(el) == 0:
+        return el.text
+    if len(el) == 1 and not el.text and not el[0].tail and isinstance(el[0].tag, str):
+        return _lxml_string(el[0])
+    return None
+
+
+# Equivalente a Tag.get_text(strip=True) de BeautifulSoup
+def _lxml_text(el) -> str:
+    return ''.join(part.strip() for part in el.itertext() if part.strip())
@@ -0,0 +1,49 @@
+from multiprocessing import shared_memory
+from typing import Dict
+from .page_analyzer import analyze_page
+
+
+# HTML escrito una sola vez en memoria compartida; a los workers del pool
+# solo se les pasa el nombre del segmento y su tamaño en lugar del string.
+class SharedHTML:
+    def __init__(self, html_content: str):
+        data = html_content.encode('utf-8')
+        self.size = len(data)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(self.size, 1))
+        self.shm.buf[:self.size] = data
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    # Libera el segmento, se llama cuando termina la tarea
+    def close(self):
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Lee el HTML desde un segmento de memoria compartida
+def read_shared_html(name: str, size: int) -> str:
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        view = shm.buf[:size]
+        try:
+            return str(view, 'utf-8')
+        finally:
+            view.release()
+    finally:
+        shm.close()
+
+
+# analyze_page para ejecutar en el pool recibiendo el HTML por memoria compartida
+def analyze_shared_page(name: str, size: int, base_url: str = '', backend: str = 'bs4') -> Dict:
+    return analyze_page(read_shared_html(name, size), base_url, backend)
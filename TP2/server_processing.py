@@ -1,52 +1,192 @@
 import socketserver
+import asyncio
 import argparse
+import base64
+import shutil
 import signal
 import sys
-from multiprocessing import Pool, cpu_count
-from typing import Dict, Any
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse
 
-from processor.screenshot import generate_screenshot
+from processor.screenshot import generate_screenshot, capture_page, init_browser_pool
 from processor.performance import analyze_performance
 from processor.image_processor import extract_and_process_images
-from common.protocol import send_message, receive_message
-from common.errors import ProcessingError
+from processor.thumbnail_cache import init_thumbnail_cache
+from processor.worker_pool import WorkerPool, Job
+from processor.fair_queue import PRIORITIES, DEFAULT_PRIORITY
+from processor.spool import run_spooled, spooled
+from common.artifacts import FileArtifact
+from common.protocol import (
+    send_message, receive_message, async_send_message, async_receive_message,
+    negotiate, iter_stream_frames
+)
+from common.errors import ProcessingError, ConnectionClosedError, PoolFullError, TaskCancelledError
 
 
-process_pool = None
+process_pools = {}
+combined_capture = False
+spool_dir = None
 
+# Clase de pool de cada tarea: el trabajo con navegador queda aislado del trabajo HTTP y de imagenes
+TASK_POOLS = {
+    'screenshot': 'browser',
+    'capture': 'browser',
+    'performance': 'light',
+    'thumbnails': 'light',
+}
 
-# Handler para procesar las request del server de scrapping
+
+# Handler para procesar las request del server de scrapping.
+# La conexion es persistente: se leen requests hasta que el cliente la cierra y cada
+# una se procesa en paralelo; la respuesta lleva el mismo 'request_id' del request,
+# por lo que pueden enviarse en cualquier orden.
+# Un mensaje {'cancel': request_id} cancela las tareas de ese request, y al cerrarse la
+# conexion se cancelan todas las tareas pendientes de ella. Un mensaje {'stats': true}
+# se responde con las estadisticas de cada pool de procesos.
+# En jobs cada request se registra al recibirlo, antes de enviar sus tareas al pool: un
+# cancel que llega antes de que existan las tareas deja la marca (None) y el request no
+# las envia, o las cancela apenas las tiene.
+# Cada respuesta informa la carga del servidor en 'load' (requests en curso y tareas en cola).
 class ProcessingRequestHandler(socketserver.BaseRequestHandler):
 
+    max_concurrent_requests = 16
+
+    # Requests en curso entre todas las conexiones
+    in_flight = 0
+    in_flight_lock = threading.Lock()
+
+    @classmethod
+    def load(cls) -> Dict[str, Any]:
+        return {
+            'in_flight': cls.in_flight,
+            **queue_load()
+        }
+
+    @classmethod
+    def _track(cls, delta: int):
+        with cls.in_flight_lock:
+            cls.in_flight += delta
+
     # Maneja conexion entrante
     def handle(self):
         client_addr = self.client_address
         print(f"Nueva conexión desde {client_addr}")
 
         self.request.settimeout(95)
-        
+        self.send_lock = threading.Lock()
+        self.jobs_lock = threading.Lock()
+        self.jobs = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+            try:
+                while True:
+                    try:
+                        request = receive_message(self.request)
+                    except ConnectionClosedError:
+                        print(f"Conexión cerrada por {client_addr}")
+                        break
+                    except Exception as e:
+                        print(f"Error leyendo request de {client_addr}: {e}")
+                        self._send({'status': 'error', 'error': str(e)})
+                        break
+
+                    if 'cancel' in request:
+                        self._cancel_jobs(request['cancel'])
+                        continue
+
+                    if request.get('stats'):
+                        self._send({'pools': pool_stats(), 'request_id': request.get('request_id')})
+                        continue
+
+                    print(f"Request recibido")
+                    if request.get('request_id') is not None:
+                        with self.jobs_lock:
+                            self.jobs[request['request_id']] = []
+                    executor.submit(self._serve, request)
+            finally:
+                for request_id in list(self.jobs):
+                    self._cancel_jobs(request_id)
+
+    # Cancela las tareas de un request que el servidor de scraping abandono. El request
+    # queda marcado como cancelado hasta que termina, por si todavia no envio sus tareas.
+    def _cancel_jobs(self, request_id: str):
+        with self.jobs_lock:
+            if request_id not in self.jobs:
+                return
+            jobs = self.jobs[request_id] or []
+            self.jobs[request_id] = None
+        print(f"Cancelando el request {request_id} ({len(jobs)} tareas en curso)")
+        for job in jobs:
+            job.cancel()
+
+    # Registra las tareas de un request; devuelve False si el request ya fue cancelado
+    def _register_jobs(self, request_id: Optional[str], jobs: list) -> bool:
+        if request_id is None:
+            return True
+        with self.jobs_lock:
+            if self.jobs.get(request_id, []) is None:
+                return False
+            self.jobs[request_id] = jobs
+            return True
+
+    # Procesa un request y envia su respuesta, en formato binario si el cliente lo acepta.
+    # En modo streaming el screenshot y los thumbnails se envian en frames separados por partes.
+    def _serve(self, request: Dict[str, Any]):
+        request_id = request.get('request_id')
+        binary, compression, stream = negotiate(request.get('accept'))
+
+        self._track(1)
         try:
-            request = receive_message(self.request)
-            print(f"Request recibido")
-            
-            response = self._process_request(request)
-            
-            send_message(self.request, response)
-            print(f"Respuesta enviada a {client_addr}")
-        
+            response = self._process_request(request, raw=binary)
         except Exception as e:
-            error_response = {
+            response = {
                 'status': 'error',
                 'error': str(e)
             }
-            try:
-                send_message(self.request, error_response)
-            except:
-                pass
-            print(f"Error procesando request de {client_addr}: {e}")
+            print(f"Error procesando request de {self.client_address}: {e}")
+        finally:
+            self._track(-1)
+            with self.jobs_lock:
+                self.jobs.pop(request_id, None)
+
+        response['load'] = self.load()
+
+        if stream:
+            if self._send_stream(response, request_id, compression):
+                print(f"Respuesta enviada en streaming a {self.client_address}")
+            return
+
+        if request_id is not None:
+            response['request_id'] = request_id
+
+        if self._send(response, binary, compression):
+            print(f"Respuesta enviada a {self.client_address}")
+
+    # Envia la respuesta frame por frame; entre frames otras respuestas pueden usar el socket
+    def _send_stream(self, response: Dict[str, Any], request_id: str, compression: str = None) -> bool:
+        for frame in iter_stream_frames(response, request_id):
+            if not self._send(frame, True, compression):
+                return False
+        return True
+
+    # Envia un mensaje por la conexion; varias threads comparten el socket
+    def _send(self, response: Dict[str, Any], binary: bool = False, compression: str = None) -> bool:
+        try:
+            with self.send_lock:
+                send_message(self.request, response, binary=binary, compression=compression)
+            return True
+        except Exception as e:
+            print(f"No se pudo enviar respuesta a {self.client_address}: {e}")
+            return False
     
-    # Procesa una request y envia a iniciar sus tareas
-    def _process_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+    # Procesa una request y envia a iniciar sus tareas.
+    # Con raw=True el screenshot y los thumbnails se devuelven como bytes en lugar de base64.
+    def _process_request(self, request: Dict[str, Any], raw: bool = False) -> Dict[str, Any]:
         task_type = request.get('task_type')
         url = request.get('url')
         
@@ -56,7 +196,7 @@ class ProcessingRequestHandler(socketserver.BaseRequestHandler):
         print(f"INICIANDO TAREA para {url}")
         
         try:
-            result = self._handle_full_processing(request)
+            result = self._handle_full_processing(request, raw, request.get('request_id'))
         
             print(f"TAREA COMPLETADA para {url}")
             return result
@@ -65,38 +205,418 @@ class ProcessingRequestHandler(socketserver.BaseRequestHandler):
             print(f"Error en tarea: {e}")
             raise ProcessingError(f"Error procesando: {e}")
     
-    # Ejecuta las tareas a realizar
-    def _handle_full_processing(self, request: Dict) -> Dict:
-        url = request['url']
-        
-        screenshot_task = process_pool.apply_async(generate_screenshot, (url,))
-        performance_task = process_pool.apply_async(analyze_performance, (url,))
-        images_task = process_pool.apply_async(extract_and_process_images, (url,))
-        
+    # Ejecuta las tareas a realizar. Cada tarea tiene como deadline su timeout; al vencer
+    # (o al cancelarse el request) se cancela en el pool en lugar de seguir ocupando un proceso.
+    def _handle_full_processing(self, request: Dict, raw: bool = False, request_id: str = None) -> Dict:
+        tasks = {}
+        result = {}
         try:
-            screenshot = screenshot_task.get(timeout=60)
-        except Exception as e:
-            screenshot = f"Error al realizar el screenshot. ERROR: {e}"
-            print(f"ERROR, screenshot falló: {e}, continua la ejecucion...")
-        
+            if not self._register_jobs(request_id, []):
+                raise TaskCancelledError("Request cancelado antes de empezar")
+
+            tasks = submit_tasks(build_tasks(request), *scheduling(request))
+            if not self._register_jobs(request_id, list(tasks.values())):
+                for task in tasks.values():
+                    task.cancel()
+
+            for name, task in tasks.items():
+                try:
+                    store_result(result, name, task.get(), raw)
+                except Exception as e:
+                    store_error(result, name, e)
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        return result
+
+
+# Tareas a ejecutar por cada request: clave en la respuesta -> (funcion, args, kwargs, timeout).
+# Si el request trae el html ya descargado por el servidor A, el analisis de
+# rendimiento y el de imagenes lo reutilizan en lugar de volver a descargar la pagina.
+# Con combined_capture el screenshot y el rendimiento salen de una sola navegacion del
+# navegador (tarea 'capture'), midiendo el rendimiento con los eventos de red.
+# Si la respuesta va en streaming, las tareas con artefactos escriben el screenshot y los
+# thumbnails en archivos de spool_dir desde el worker (ver processor/spool.py).
+def build_tasks(request: Dict[str, Any]) -> Dict[str, tuple]:
+    url = request['url']
+    html = request.get('html')
+    base_url = request.get('url_final') or url
+
+    performance_kwargs = {}
+    images_kwargs = {}
+    if html is not None:
+        performance_kwargs = {'html': html, 'load_time_ms': request.get('load_time_ms'), 'base_url': base_url}
+        images_kwargs = {'html': html, 'base_url': base_url}
+
+    if combined_capture:
+        tasks = {
+            'capture': (capture_page, (url,), {}, 60),
+            'thumbnails': (extract_and_process_images, (url,), images_kwargs, 90),
+        }
+    else:
+        tasks = {
+            'screenshot': (generate_screenshot, (url,), {}, 60),
+            'performance': (analyze_performance, (url,), performance_kwargs, 60),
+            'thumbnails': (extract_and_process_images, (url,), images_kwargs, 90),
+        }
+
+    if spool_dir and negotiate(request.get('accept'))[2]:
+        tasks = {
+            name: (run_spooled, (spool_dir, name, func, args, kwargs), {}, timeout)
+            if name in SPOOLED_TASKS else (func, args, kwargs, timeout)
+            for name, (func, args, kwargs, timeout) in tasks.items()
+        }
+
+    return tasks
+
+
+# Tareas cuyos artefactos se escriben a archivos cuando la respuesta va en streaming
+SPOOLED_TASKS = ('screenshot', 'capture', 'thumbnails')
+
+
+# Adapta el resultado de una tarea. Con raw=True el screenshot y los thumbnails
+# se pasan de base64 a bytes para enviarlos en formato binario, o a FileArtifact
+# si el worker ya los escribio a un archivo.
+def task_result(name: str, value: Any, raw: bool = False) -> Any:
+    if not raw:
+        return value
+
+    if name == 'screenshot':
+        return raw_artifact(value)
+
+    # Se arman dicts nuevos: el resultado de la tarea puede seguir referenciado por el pool
+    # y un FileArtifact debe liberarse (y su archivo borrarse) apenas se envia la respuesta
+    if name == 'thumbnails':
+        return [
+            {**thumbnail, 'thumbnail_base64': raw_artifact(thumbnail['thumbnail_base64'])}
+            if thumbnail.get('thumbnail_base64') else thumbnail
+            for thumbnail in value
+        ]
+
+    return value
+
+
+def raw_artifact(value: Any) -> Any:
+    spool = spooled(value)
+    if spool:
+        return FileArtifact(*spool)
+    return base64.b64decode(value)
+
+
+# Envia las tareas al pool con deadline = ahora + timeout de cada una
+def submit_tasks(tasks: Dict[str, tuple], priority: str = DEFAULT_PRIORITY, flow: str = None) -> Dict[str, Job]:
+    now = time.monotonic()
+    return {
+        name: submit_task(name, func, args, kwargs, now + timeout, priority=priority, flow=flow)
+        for name, (func, args, kwargs, timeout) in tasks.items()
+    }
+
+
+# Prioridad y flujo de un request para el reparto del pool. El flujo es el cliente que
+# informa el servidor A o, si no viene (o no es un string), el dominio de la URL.
+def scheduling(request: Dict[str, Any]) -> tuple:
+    priority = request.get('priority')
+    if not isinstance(priority, str) or priority not in PRIORITIES:
+        priority = DEFAULT_PRIORITY
+    client = request.get('client')
+    flow = client if isinstance(client, str) and client else urlparse(request['url']).netloc.lower()
+    return priority, flow
+
+
+# Envia una tarea al pool de su clase. Si el pool la rechaza por tener la cola llena
+# devuelve una tarea ya terminada con ese error, y el resto del request sigue igual.
+def submit_task(name: str, func, args: tuple, kwargs: Dict, deadline: float,
+                callback=None, error_callback=None, priority: str = DEFAULT_PRIORITY, flow: str = None) -> Job:
+    try:
+        return process_pools[TASK_POOLS[name]].apply_async(
+            func, args, kwargs,
+            callback=callback,
+            error_callback=error_callback,
+            deadline=deadline,
+            priority=priority,
+            flow=flow
+        )
+    except PoolFullError as e:
+        print(f"[WARN] {e}, se rechaza la tarea {name}")
+        job = Job(func, args, kwargs, deadline, callback, error_callback)
+        job.finish(error=e)
+        return job
+
+
+# Estadisticas de cada pool de procesos (uso, cola, tareas vencidas, etc.)
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: pool.get_stats() for name, pool in unique_pools().items()}
+
+
+# Tareas esperando en los pools de procesos, en total y por pool, para informar la carga
+def queue_load() -> Dict[str, Any]:
+    queued = {name: pool.queue.qsize() for name, pool in unique_pools().items()}
+    return {
+        'queued': sum(queued.values()),
+        'queued_by_pool': queued
+    }
+
+
+# Pools distintos por nombre: con un unico pool compartido todas las clases apuntan al mismo
+def unique_pools() -> Dict[str, WorkerPool]:
+    return {pool.name: pool for pool in process_pools.values()}
+
+
+# Claves de la respuesta que completa la tarea 'capture'
+CAPTURE_KEYS = ('screenshot', 'performance')
+
+
+# Guarda el resultado de una tarea en la respuesta. La tarea 'capture' completa
+# a la vez el screenshot y el rendimiento.
+def store_result(result: Dict[str, Any], name: str, value: Any, raw: bool = False):
+    if name == 'capture':
+        for key in CAPTURE_KEYS:
+            result[key] = task_result(key, value[key], raw)
+    else:
+        result[name] = task_result(name, value, raw)
+
+
+# Guarda el error de una tarea en cada clave de la respuesta que debia completar
+# La tarea sigue guardando la excepcion y su traceback apunta al frame que la leyo (y a
+# result): se descarta para no formar un ciclo que retenga los artefactos en disco.
+def store_error(result: Dict[str, Any], name: str, error: Exception):
+    error.__traceback__ = None
+    for key in (CAPTURE_KEYS if name == 'capture' else (name,)):
+        result[key] = task_error(key, error)
+
+
+TASK_ERRORS = {
+    'screenshot': ("Error al realizar el screenshot", "screenshot falló"),
+    'performance': ("Error al analizar el rendimiento", "Análisis de rendimiento falló"),
+    'thumbnails': ("Error al procesar imágenes", "Procesamiento de imágenes falló"),
+}
+
+
+# Mensaje de error de una tarea fallida; el resto de las tareas sigue su ejecucion
+def task_error(name: str, error: Exception) -> str:
+    message, log = TASK_ERRORS[name]
+    print(f"ERROR, {log}: {error}, continua la ejecucion...")
+    return f"{message}. ERROR: {error}"
+    
+
+# Servidor asyncio con admision acotada. Como maximo max_in_flight requests se procesan
+# a la vez; si esta lleno responde enseguida con status 'busy' y un 'retry_after' en lugar
+# de encolar sin limite. Las tareas del pool se esperan con callbacks, sin bloquear threads,
+# y cada respuesta informa la carga actual del servidor en 'load'. Un mensaje
+# {'cancel': request_id} o el cierre de la conexion cancelan las tareas del request.
+class AsyncProcessingServer:
+
+    idle_timeout = 95
+    idle_check_interval = 5
+
+    def __init__(self, host: str, port: int, max_in_flight: int, retry_after: int = 5):
+        self.host = host
+        self.port = port
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.in_flight = 0
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        async with server:
+            await server.serve_forever()
+
+    def load(self) -> Dict[str, Any]:
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            **queue_load()
+        }
+
+    # Lee requests de una conexion persistente y lanza cada una como tarea
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client_addr = writer.get_extra_info('peername')
+        print(f"Nueva conexión desde {client_addr}")
+
+        write_lock = asyncio.Lock()
+        tasks = {}
+        activity = {'last': time.monotonic()}
+
         try:
-            performance = performance_task.get(timeout=60)
-        except Exception as e:
-            performance = f"Error al analizar el rendimiento. ERROR: {e}"
-            print(f"[ERROR, Análisis de rendimiento falló: {e}, continua la ejecucion...")
-        
+            while True:
+                try:
+                    request = await self._next_request(reader, tasks, activity)
+                except ConnectionClosedError:
+                    print(f"Conexión cerrada por {client_addr}")
+                    break
+                except Exception as e:
+                    print(f"Error leyendo request de {client_addr}: {e}")
+                    break
+
+                if request is None:
+                    print(f"Conexión inactiva con {client_addr}, se cierra")
+                    break
+                activity['last'] = time.monotonic()
+
+                if 'cancel' in request:
+                    task = tasks.get(request['cancel'])
+                    if task is not None:
+                        print(f"Cancelando request {request['cancel']}")
+                        task.cancel()
+                    continue
+
+                if request.get('stats'):
+                    await self._send(writer, write_lock, {'pools': pool_stats(), 'request_id': request.get('request_id')})
+                    continue
+
+                if self.in_flight >= self.max_in_flight:
+                    print(f"Servidor ocupado ({self.in_flight}/{self.max_in_flight}), request rechazado")
+                    await self._send(writer, write_lock, self._busy_response(request))
+                    continue
+
+                self.in_flight += 1
+                key = request.get('request_id') or object()
+                task = asyncio.create_task(self._serve(request, writer, write_lock))
+                tasks[key] = task
+                task.add_done_callback(lambda _, key=key: self._request_done(tasks, key, activity))
+
+        finally:
+            # La conexion se cerro: nadie va a recibir las respuestas pendientes
+            pending = list(tasks.values())
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            writer.close()
+
+    # Espera el proximo request de la conexion. Devuelve None si la conexion esta inactiva:
+    # sin requests en curso y sin actividad (request recibido o respuesta enviada) durante
+    # idle_timeout segundos. Una conexion con requests lentos de responder no se cierra,
+    # y la lectura de un mensaje no se corta por tiempo mientras haya requests en curso.
+    async def _next_request(self, reader: asyncio.StreamReader, tasks: Dict, activity: Dict) -> Optional[Dict]:
+        receive = asyncio.ensure_future(async_receive_message(reader, retries=1))
         try:
-            thumbnails = images_task.get(timeout=90)
+            while True:
+                done, _ = await asyncio.wait({receive}, timeout=self.idle_check_interval)
+                if done:
+                    return receive.result()
+                if not tasks and time.monotonic() - activity['last'] >= self.idle_timeout:
+                    return None
+        finally:
+            if not receive.done():
+                receive.cancel()
+
+    # Un request termino (su respuesta ya se envio): cuenta como actividad de la conexion
+    def _request_done(self, tasks: Dict, key, activity: Dict):
+        tasks.pop(key, None)
+        activity['last'] = time.monotonic()
+
+    # Procesa un request ya admitido y envia su respuesta
+    async def _serve(self, request: Dict[str, Any], writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        request_id = request.get('request_id')
+        binary, compression, stream = negotiate(request.get('accept'))
+
+        try:
+            response = await self._process_request(request, raw=binary)
         except Exception as e:
-            thumbnails = f"Error al procesar imágenes. ERROR: {e}"
-            print(f"ERROR, Procesamiento de imágenes falló: {e}, continua la ejecucion...")
-        
-        return {
-            'screenshot': screenshot,
-            'performance': performance,
-            'thumbnails': thumbnails
+            response = {
+                'status': 'error',
+                'error': str(e)
+            }
+            print(f"Error procesando request: {e}")
+        finally:
+            self.in_flight -= 1
+
+        response['load'] = self.load()
+
+        if stream:
+            # Los artefactos pueden estar en archivos: cada parte se lee fuera del event loop
+            loop = asyncio.get_running_loop()
+            frames = iter_stream_frames(response, request_id)
+            while True:
+                frame = await loop.run_in_executor(None, next, frames, None)
+                if frame is None:
+                    return
+                if not await self._send(writer, write_lock, frame, True, compression):
+                    frames.close()
+                    return
+
+        if request_id is not None:
+            response['request_id'] = request_id
+        await self._send(writer, write_lock, response, binary, compression)
+
+    async def _process_request(self, request: Dict[str, Any], raw: bool = False) -> Dict[str, Any]:
+        url = request.get('url')
+        if not url:
+            raise ValueError("ERROR, URL no proporcionada en el request")
+
+        print(f"INICIANDO TAREA para {url}")
+
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        priority, flow = scheduling(request)
+        tasks = {
+            name: self._submit(loop, name, func, args, kwargs, now + timeout, priority, flow)
+            for name, (func, args, kwargs, timeout) in build_tasks(request).items()
         }
-    
+
+        result = {}
+        try:
+            for name, (future, job) in tasks.items():
+                try:
+                    store_result(result, name, await asyncio.wait_for(future, job.remaining()), raw)
+                except Exception as e:
+                    store_error(result, name, e)
+        finally:
+            # Si se vencio el timeout o se cancelo el request, las tareas no siguen en el pool.
+            # El future se cancela antes que la tarea: nadie va a leer el error que esta reporta.
+            for future, job in tasks.values():
+                future.cancel()
+                job.cancel()
+
+        print(f"TAREA COMPLETADA para {url}")
+        return result
+
+    # Envia una tarea al pool y devuelve un future de asyncio que se completa por callback,
+    # junto a la tarea del pool para poder cancelarla
+    def _submit(self, loop: asyncio.AbstractEventLoop, name: str, func, args: tuple, kwargs: Dict,
+                deadline: float, priority: str = DEFAULT_PRIORITY, flow: str = None) -> tuple:
+        future = loop.create_future()
+
+        def _resolve(value=None, error=None):
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+        job = submit_task(
+            name, func, args, kwargs, deadline,
+            callback=lambda value: loop.call_soon_threadsafe(_resolve, value),
+            error_callback=lambda error: loop.call_soon_threadsafe(_resolve, None, error),
+            priority=priority,
+            flow=flow
+        )
+        return future, job
+
+    def _busy_response(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        response = {
+            'status': 'busy',
+            'error': f"Servidor ocupado, reintentar en {self.retry_after}s",
+            'retry_after': self.retry_after,
+            'load': self.load()
+        }
+        if request.get('request_id') is not None:
+            response['request_id'] = request['request_id']
+        return response
+
+    async def _send(self, writer: asyncio.StreamWriter, write_lock: asyncio.Lock, message: Dict[str, Any],
+                    binary: bool = False, compression: str = None) -> bool:
+        try:
+            async with write_lock:
+                await async_send_message(writer, message, retries=1, binary=binary, compression=compression)
+            return True
+        except Exception as e:
+            print(f"No se pudo enviar respuesta: {e}")
+            return False
+
 
 # Servidor de threads, maneja una thread por conexion
 class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
@@ -129,48 +649,338 @@ def parse_arguments():
         default=3,
         help=f'Número de procesos en el pool (default: 3)'
     )
+
+    parser.add_argument(
+        '--queue-limit',
+        type=int,
+        default=0,
+        help='Máximo de tareas esperando en el pool antes de rechazar nuevas, 0 sin límite (default: 0)'
+    )
+
+    parser.add_argument(
+        '--maxtasksperchild',
+        type=int,
+        default=None,
+        help='Tareas tras las cuales se recicla cada proceso del pool (default: sin reciclar)'
+    )
+
+    parser.add_argument(
+        '--split-pools',
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help='Usar un pool para las tareas con navegador y otro para rendimiento e imágenes (default: no)'
+    )
+
+    parser.add_argument(
+        '--browser-processes',
+        type=int,
+        default=2,
+        help='Con --split-pools: procesos del pool de navegador (default: 2)'
+    )
+
+    parser.add_argument(
+        '--browser-queue-limit',
+        type=int,
+        default=0,
+        help='Con --split-pools: máximo de tareas en cola del pool de navegador, 0 sin límite (default: 0)'
+    )
+
+    parser.add_argument(
+        '--browser-maxtasksperchild',
+        type=int,
+        default=None,
+        help='Con --split-pools: tareas tras las cuales se recicla un proceso del pool de navegador (default: sin reciclar)'
+    )
+
+    parser.add_argument(
+        '--light-processes',
+        type=int,
+        default=2,
+        help='Con --split-pools: procesos del pool de rendimiento e imágenes (default: 2)'
+    )
+
+    parser.add_argument(
+        '--light-queue-limit',
+        type=int,
+        default=0,
+        help='Con --split-pools: máximo de tareas en cola del pool de rendimiento e imágenes, 0 sin límite (default: 0)'
+    )
+
+    parser.add_argument(
+        '--light-maxtasksperchild',
+        type=int,
+        default=None,
+        help='Con --split-pools: tareas tras las cuales se recicla un proceso del pool liviano (default: sin reciclar)'
+    )
+
+    parser.add_argument(
+        '--elastic',
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help='Pool elástico: la cantidad de procesos de cada pool pasa a ser su máximo y se ajusta según la espera de la cola (default: no)'
+    )
+
+    parser.add_argument(
+        '--min-processes',
+        type=int,
+        default=1,
+        help='Con --elastic: procesos mínimos de cada pool (default: 1)'
+    )
+
+    parser.add_argument(
+        '--scale-up-wait',
+        type=float,
+        default=1.0,
+        help='Con --elastic: segundos de espera en cola a partir de los cuales se agrega un proceso (default: 1.0)'
+    )
+
+    parser.add_argument(
+        '--scale-down-idle',
+        type=float,
+        default=30.0,
+        help='Con --elastic: segundos con procesos ociosos tras los cuales se quita uno (default: 30)'
+    )
+
+    parser.add_argument(
+        '--cpu-limit',
+        type=float,
+        default=85.0,
+        help='Con --elastic: uso de CPU (%%) a partir del cual no se agregan procesos (default: 85)'
+    )
+
+    parser.add_argument(
+        '--min-free-memory-mb',
+        type=int,
+        default=512,
+        help='Con --elastic: memoria libre mínima para agregar un proceso (default: 512)'
+    )
+
+    parser.add_argument(
+        '--worker-max-rss-mb',
+        type=int,
+        default=None,
+        help='Memoria de un proceso del pool (con sus hijos) a partir de la cual se recicla (default: sin límite)'
+    )
+
+    parser.add_argument(
+        '--client-weight',
+        action='append',
+        metavar='CLIENTE=PESO',
+        help='Peso en el reparto justo del pool para un cliente o dominio, puede repetirse (default: 1 cada uno)'
+    )
+
+    parser.add_argument(
+        '--browsers-per-worker',
+        type=int,
+        default=1,
+        help='Navegadores Chromium que mantiene abiertos cada proceso del pool (default: 1)'
+    )
+
+    parser.add_argument(
+        '--browser-max-pages',
+        type=int,
+        default=50,
+        help='Páginas tras las cuales se recicla un navegador (default: 50)'
+    )
+
+    parser.add_argument(
+        '--browser-max-memory-mb',
+        type=int,
+        default=1024,
+        help='Memoria de los navegadores de un proceso a partir de la cual se reciclan (default: 1024)'
+    )
+
+    parser.add_argument(
+        '--browser-warmup',
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help='Lanzar los navegadores al iniciar el servidor (default: sí)'
+    )
+
+    parser.add_argument(
+        '--thumbnail-cache-mb',
+        type=int,
+        default=32,
+        help='Memoria de la cache de thumbnails por proceso en MB, 0 para desactivarla (default: 32)'
+    )
+
+    parser.add_argument(
+        '--thumbnail-cache-dir',
+        type=str,
+        default=None,
+        help='Directorio donde la cache de thumbnails guarda lo desalojado de memoria (default: sin disco)'
+    )
+
+    parser.add_argument(
+        '--thumbnail-url-ttl',
+        type=int,
+        default=3600,
+        help='Segundos que se recuerda el contenido (o el error) de la URL de una imagen (default: 3600)'
+    )
+
+    parser.add_argument(
+        '--combined-capture',
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help='Tomar el screenshot y medir el rendimiento con una sola navegación del navegador (default: no)'
+    )
+
+    parser.add_argument(
+        '--mode',
+        choices=['thread', 'async'],
+        default='thread',
+        help='thread: una thread por conexión; async: servidor asyncio con admisión acotada (default: thread)'
+    )
+
+    parser.add_argument(
+        '--max-in-flight',
+        type=int,
+        default=None,
+        help='Modo async: máximo de requests procesándose a la vez antes de responder "busy" (default: 2 x procesos totales)'
+    )
+
+    parser.add_argument(
+        '--retry-after',
+        type=int,
+        default=5,
+        help='Modo async: segundos sugeridos para reintentar cuando el servidor está ocupado (default: 5)'
+    )
     
     return parser.parse_args()
 
 
+# Inicializa cada proceso del pool: navegadores precalentados (salvo en el pool sin
+# tareas de navegador, browser_args=None) y cache de thumbnails
+def init_worker(browser_args: Optional[tuple], thumbnail_args: tuple):
+    if browser_args is not None:
+        init_browser_pool(*browser_args)
+    init_thumbnail_cache(*thumbnail_args)
+
+
+# Convierte las opciones '--client-weight CLIENTE=PESO' en un dict
+def parse_weights(values: Optional[list]) -> Dict[str, float]:
+    weights = {}
+    for value in values or []:
+        flow, _, weight = value.rpartition('=')
+        try:
+            weight = float(weight)
+        except ValueError:
+            weight = 0
+        if not flow or weight <= 0:
+            raise ValueError(f"Peso inválido en --client-weight: {value}")
+        weights[flow] = weight
+    return weights
+
+
 def signal_handler(sig, frame):
     print("\nSeñal de terminación recibida. Cerrando servidor...")
     
-    if process_pool:
-        print("Cerrando pool de procesos...")
-        process_pool.close()
-        process_pool.terminate()
-        process_pool.join()
+    if process_pools:
+        print("Cerrando pools de procesos...")
+        close_pools()
     
     sys.exit(0)
 
 
+def close_pools():
+    for pool in unique_pools().values():
+        pool.close()
+        pool.terminate()
+        pool.join()
+    process_pools.clear()
+
+
 def main():
-    global process_pool
+    global combined_capture
     
     args = parse_arguments()
+    combined_capture = args.combined_capture
     
     print("=" * 60)
     print("SERVIDOR DE PROCESAMIENTO DISTRIBUIDO")
     print("=" * 60)
     print(f"Dirección: {args.ip}")
     print(f"Puerto: {args.port}")
-    print(f"Procesos en pool: {args.processes}")
+    if args.split_pools:
+        print(f"Pools separados: browser={args.browser_processes} procesos, light={args.light_processes} procesos")
+    else:
+        print(f"Procesos en pool: {args.processes}")
+    if args.elastic:
+        print(f"Pool elástico: mínimo {args.min_processes} procesos por pool")
+    print(f"Modo: {args.mode}")
+    print(f"Captura combinada: {'sí' if args.combined_capture else 'no'}")
     print("=" * 60)
     
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
+    global spool_dir
+    spool_dir = tempfile.mkdtemp(prefix='tp2-spool-')
+
     try:
-        print(f"Inicializando pool con {args.processes} procesos...")
-        process_pool = Pool(processes=args.processes)
-        print("Pool de procesos inicializado")
-        
-        server = ThreadedTCPServer((args.ip, args.port), ProcessingRequestHandler)
-        print(f"Servidor escuchando en {args.ip}:{args.port}")
-        print("Esperando conexiones... (Ctrl+C para detener)")
+        weights = parse_weights(args.client_weight)
+        scaling = {
+            'min_processes': args.min_processes if args.elastic else None,
+            'scale_up_wait': args.scale_up_wait,
+            'scale_down_idle': args.scale_down_idle,
+            'cpu_limit': args.cpu_limit,
+            'min_free_memory_mb': args.min_free_memory_mb,
+            'max_rss_mb': args.worker_max_rss_mb
+        }
+        browser_args = (args.browsers_per_worker, args.browser_max_pages, args.browser_max_memory_mb, args.browser_warmup)
+        thumbnail_args = (args.thumbnail_cache_mb, args.thumbnail_cache_dir, args.thumbnail_url_ttl)
+
+        if args.split_pools:
+            browser_pool = WorkerPool(
+                processes=args.browser_processes,
+                initializer=init_worker,
+                initargs=(browser_args, thumbnail_args),
+                name='browser',
+                max_queue=args.browser_queue_limit,
+                maxtasksperchild=args.browser_maxtasksperchild,
+                weights=weights,
+                **scaling
+            )
+            light_pool = WorkerPool(
+                processes=args.light_processes,
+                initializer=init_worker,
+                initargs=(None, thumbnail_args),
+                name='light',
+                max_queue=args.light_queue_limit,
+                maxtasksperchild=args.light_maxtasksperchild,
+                weights=weights,
+                **scaling
+            )
+            process_pools.update({'browser': browser_pool, 'light': light_pool})
+            print(f"Pools inicializados: browser con {args.browser_processes} procesos, light con {args.light_processes}")
+        else:
+            print(f"Inicializando pool con {args.processes} procesos...")
+            pool = WorkerPool(
+                processes=args.processes,
+                initializer=init_worker,
+                initargs=(browser_args, thumbnail_args),
+                name='shared',
+                max_queue=args.queue_limit,
+                maxtasksperchild=args.maxtasksperchild,
+                weights=weights,
+                **scaling
+            )
+            process_pools.update({'browser': pool, 'light': pool})
+            print("Pool de procesos inicializado")
         
-        server.serve_forever()
+        if args.mode == 'async':
+            total_processes = sum(pool.max_processes for pool in unique_pools().values())
+            max_in_flight = args.max_in_flight or 2 * total_processes
+            server = AsyncProcessingServer(args.ip, args.port, max_in_flight, args.retry_after)
+            print(f"Servidor asyncio escuchando en {args.ip}:{args.port} (máximo {max_in_flight} requests en curso)")
+            print("Esperando conexiones... (Ctrl+C para detener)")
+            asyncio.run(server.serve_forever())
+        else:
+            server = ThreadedTCPServer((args.ip, args.port), ProcessingRequestHandler)
+            print(f"Servidor escuchando en {args.ip}:{args.port}")
+            print("Esperando conexiones... (Ctrl+C para detener)")
+            
+            server.serve_forever()
     
     except OSError as e:
         print(f"ERROR, No se pudo iniciar el servidor: {e}")
@@ -181,10 +991,9 @@ def main():
         sys.exit(1)
     
     finally:
-        if process_pool:
-            process_pool.close()
-            process_pool.terminate()
-            process_pool.join()
+        if process_pools:
+            close_pools()
+        shutil.rmtree(spool_dir, ignore_errors=True)
         print('\n')
         print('CIERRE DE SERVIDOR COMPLETADO')
 
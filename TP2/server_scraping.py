@@ -1,51 +1,388 @@
 import asyncio
 import argparse
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import signal
 import uuid
 import time
 from datetime import datetime, timedelta
-from typing import Dict, Optional
-from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from collections import defaultdict, OrderedDict
 from aiohttp import web
 import json
 import signal
 import sys
+import os
+import hashlib
+import base64
+import sqlite3
+import shutil
+import tempfile
 
-from scraper import parse_html, extract_metadata, fetch_url
-from common.protocol import async_send_message, async_receive_message
+from scraper import analyze_page, analyze_shared_page, SharedHTML, fetch_url, create_session, PARSER_BACKENDS
+from common.protocol import MultiplexedConnection
 from common.errors import ScrapingError, RateLimitError
-from common.serialization import serialize_data
+from common.serialization import serialize_data, serialize_parts
+from common.artifacts import FileArtifact, FileArtifactSink
 
 
-# Sistema de Cache 
+# Cache persistente en disco (SQLite), compartido entre reinicios y procesos del host.
+# Los valores grandes (screenshots, thumbnails) se guardan fuera de la base como archivos.
+# Los metodos son bloqueantes: Cache los ejecuta en una unica thread (executor) para no
+# frenar el event loop, por eso la conexion se crea con check_same_thread=False.
+class DiskCache:
+    BLOB_MIN_SIZE = 64 * 1024
+
+    def __init__(self, path: str, ttl_seconds: int = 3600):
+        self.path = path
+        self.ttl = ttl_seconds
+        self.blobs_dir = os.path.join(path, 'blobs')
+        os.makedirs(self.blobs_dir, exist_ok=True)
+
+        self.db = sqlite3.connect(os.path.join(path, 'cache.db'), timeout=10, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, timestamp REAL NOT NULL, data TEXT NOT NULL, blobs TEXT NOT NULL, '
+            'validators TEXT)'
+        )
+        # Referencias de cada entrada a sus blobs, indexadas por blob para saber si sigue en uso
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS blob_refs ('
+            'key TEXT NOT NULL, blob TEXT NOT NULL, PRIMARY KEY (key, blob))'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS blob_refs_blob ON blob_refs (blob)')
+        self._migrate_blob_refs()
+        self.db.commit()
+
+    # Devuelve (data, timestamp, validators) si la entrada existe y no vencio
+    def get(self, key: str) -> Optional[Tuple[Dict, float, Dict]]:
+        row = self.db.execute(
+            'SELECT timestamp, data, validators FROM entries WHERE key = ?', (key,)
+        ).fetchone()
+
+        if not row:
+            return None
+
+        timestamp, data, validators = row
+        if time.time() - timestamp >= self.ttl:
+            return None
+
+        try:
+            return self._load_blobs(json.loads(data)), timestamp, json.loads(validators or '{}')
+        except OSError:
+            # Un blob fue eliminado por otro proceso, se considera miss
+            return None
+
+    def set(self, key: str, data: Dict, timestamp: float, validators: Optional[Dict] = None):
+        blobs = []
+        stored = json.loads(serialize_data(self._store_blobs(data, blobs)))
+        blobs = sorted(set(blobs))
+
+        old_blobs = self._entry_blobs(key)
+        self.db.execute(
+            'INSERT OR REPLACE INTO entries (key, timestamp, data, blobs, validators) VALUES (?, ?, ?, ?, ?)',
+            (key, timestamp, json.dumps(stored, ensure_ascii=False), json.dumps(blobs), json.dumps(validators or {}))
+        )
+        self.db.execute('DELETE FROM blob_refs WHERE key = ?', (key,))
+        self.db.executemany('INSERT INTO blob_refs (key, blob) VALUES (?, ?)', [(key, name) for name in blobs])
+        self.db.commit()
+        self._delete_unreferenced(set(old_blobs) - set(blobs))
+
+    # Elimina las entradas vencidas y sus blobs, devuelve cuantas se eliminaron
+    def purge_expired(self) -> int:
+        limit = time.time() - self.ttl
+        keys = [key for (key,) in self.db.execute(
+            'SELECT key FROM entries WHERE timestamp <= ?', (limit,)
+        ).fetchall()]
+
+        if not keys:
+            return 0
+
+        blobs = set()
+        for key in keys:
+            blobs.update(self._entry_blobs(key))
+        self.db.executemany('DELETE FROM blob_refs WHERE key = ?', [(key,) for key in keys])
+        self.db.execute('DELETE FROM entries WHERE timestamp <= ?', (limit,))
+        self.db.commit()
+        self._delete_unreferenced(blobs)
+
+        return len(keys)
+
+    def close(self):
+        self.db.close()
+
+    # Reemplaza strings grandes por referencias a archivos nombrados por su hash. Los bytes
+    # y los artefactos en disco (FileArtifact) se guardan como su base64; un FileArtifact
+    # se copia al blob por partes, sin cargarlo entero en memoria.
+    def _store_blobs(self, obj, blobs: List[str]):
+        if isinstance(obj, dict):
+            return {k: self._store_blobs(v, blobs) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self._store_blobs(v, blobs) for v in obj]
+        if isinstance(obj, (bytes, bytearray)):
+            obj = base64.b64encode(obj).decode('utf-8')
+        if isinstance(obj, FileArtifact):
+            if 4 * ((obj.size + 2) // 3) < self.BLOB_MIN_SIZE:
+                return base64.b64encode(obj.read()).decode('utf-8')
+            name = self._write_blob(obj.iter_base64())
+            blobs.append(name)
+            return {'__blob__': name}
+        if isinstance(obj, str) and len(obj) >= self.BLOB_MIN_SIZE:
+            name = self._write_blob([obj.encode('utf-8')])
+            blobs.append(name)
+            return {'__blob__': name}
+        return obj
+
+    # Escribe un blob a partir de sus partes y devuelve su nombre (hash del contenido)
+    def _write_blob(self, chunks) -> str:
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(self.blobs_dir, f"{uuid.uuid4().hex}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+
+        name = digest.hexdigest()
+        blob_path = os.path.join(self.blobs_dir, name)
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, blob_path)
+        return name
+
+    # Vuelve a insertar el contenido de los blobs referenciados
+    def _load_blobs(self, obj):
+        if isinstance(obj, dict):
+            if set(obj) == {'__blob__'}:
+                with open(os.path.join(self.blobs_dir, obj['__blob__']), 'rb') as f:
+                    return f.read().decode('utf-8')
+            return {k: self._load_blobs(v) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self._load_blobs(v) for v in obj]
+        return obj
+
+    def _entry_blobs(self, key: str) -> List[str]:
+        rows = self.db.execute(
+            'SELECT blob FROM blob_refs WHERE key = ?', (key,)
+        ).fetchall()
+        return [name for (name,) in rows]
+
+    # Borra los blobs que ya no referencia ninguna entrada
+    def _delete_unreferenced(self, names):
+        for name in names:
+            in_use = self.db.execute(
+                'SELECT 1 FROM blob_refs WHERE blob = ? LIMIT 1', (name,)
+            ).fetchone()
+            if not in_use:
+                try:
+                    os.remove(os.path.join(self.blobs_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    # Completa blob_refs a partir de la columna blobs en bases creadas antes de esa tabla
+    def _migrate_blob_refs(self):
+        if self.db.execute('SELECT 1 FROM blob_refs LIMIT 1').fetchone():
+            return
+        rows = self.db.execute("SELECT key, blobs FROM entries WHERE blobs != '[]'").fetchall()
+        self.db.executemany(
+            'INSERT OR IGNORE INTO blob_refs (key, blob) VALUES (?, ?)',
+            [(key, name) for key, blobs in rows for name in json.loads(blobs)]
+        )
+
+
+# Sistema de Cache con limite de memoria y desalojo LRU/LFU.
+# Con stale_seconds > 0 las entradas vencidas se conservan ese tiempo extra
+# para poder servirlas mientras se revalidan en segundo plano.
+# Las operaciones sobre el DiskCache corren en una thread propia, fuera del event loop.
 class Cache:
-    def __init__(self, ttl_seconds: int = 3600):
-        self.cache = {}
+    def __init__(self, ttl_seconds: int = 3600, max_bytes: int = 256 * 1024 * 1024, policy: str = 'lru',
+                 disk: Optional[DiskCache] = None, stale_seconds: int = 0):
+        if policy not in ('lru', 'lfu'):
+            raise ValueError(f"Politica de cache invalida: {policy}")
+
+        self.cache = OrderedDict()
         self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.disk = disk
+        self.disk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='disk-cache') if disk else None
+        self.stale_seconds = stale_seconds
+        self.retention = ttl_seconds + stale_seconds
+        self.current_bytes = 0
+        self.stats = {
+            'hits': 0,
+            'disk_hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+    
+    async def get(self, key: str) -> Optional[Dict]:
+        entry = await self._lookup(key, self.ttl)
+        if entry:
+            self.stats['hits'] += 1
+            print(f"[CACHE HIT] {key}")
+            return entry['data']
+
+        self.stats['misses'] += 1
+        return None
+
+    # Devuelve (data, validators) de una entrada vencida que todavia puede servirse
+    async def get_stale(self, key: str) -> Optional[Tuple[Dict, Dict]]:
+        entry = await self._lookup(key, self.retention)
+        if entry:
+            self.stats['stale_hits'] += 1
+            print(f"[CACHE STALE] {key}")
+            return entry['data'], entry['validators']
+        return None
     
-    def get(self, key: str) -> Optional[Dict]:
+    async def set(self, key: str, data: Dict, validators: Optional[Dict] = None):
+        timestamp = time.time()
+        self._store(key, data, timestamp, validators)
+
+        if self.disk:
+            try:
+                # Copia: quien lee la entrada de memoria puede marcar 'from_cache' mientras se escribe
+                await self._run_disk(self.disk.set, key, dict(data), timestamp, validators)
+            except (sqlite3.Error, OSError) as e:
+                print(f"[CACHE DISK ERROR] No se pudo persistir {key}: {e}")
+
+        print(f"[CACHE SET] {key}")
+
+    # Busca una entrada con antiguedad menor a max_age, primero en memoria y luego en disco
+    async def _lookup(self, key: str, max_age: float) -> Optional[Dict]:
         if key in self.cache:
             entry = self.cache[key]
-            if time.time() - entry['timestamp'] < self.ttl:
-                print(f"[CACHE HIT] {key}")
-                return entry['data']
-            else:
-                del self.cache[key]
+            age = time.time() - entry['timestamp']
+            if age < max_age:
+                entry['hits'] += 1
+                self.cache.move_to_end(key)
+                return entry
+            if age >= self.retention:
+                self._remove(key)
+                self.stats['expirations'] += 1
                 print(f"[CACHE EXPIRED] {key}")
+
+        if self.disk:
+            try:
+                stored = await self._run_disk(self.disk.get, key)
+            except (sqlite3.Error, OSError) as e:
+                print(f"[CACHE DISK ERROR] No se pudo leer {key}: {e}")
+                stored = None
+            if stored and time.time() - stored[1] < max_age:
+                data, timestamp, validators = stored
+                self._store(key, data, timestamp, validators)
+                self.stats['disk_hits'] += 1
+                print(f"[CACHE DISK HIT] {key}")
+                return {'data': data, 'timestamp': timestamp, 'validators': validators}
+
         return None
-    
-    def set(self, key: str, data: Dict):
+
+    # Guarda la entrada en memoria respetando el limite de bytes
+    def _store(self, key: str, data: Dict, timestamp: float, validators: Optional[Dict] = None):
+        size = self._entry_size(data)
+
+        if size > self.max_bytes:
+            print(f"[CACHE SKIP] {key} ({size} bytes) excede el limite del cache")
+            return
+
+        if key in self.cache:
+            self._remove(key)
+
+        while self.cache and self.current_bytes + size > self.max_bytes:
+            self._evict()
+
         self.cache[key] = {
             'data': data,
-            'timestamp': time.time()
+            'timestamp': timestamp,
+            'validators': validators or {},
+            'size': size,
+            'hits': 0
         }
-        print(f"[CACHE SET] {key}")
+        self.current_bytes += size
     
+    # Elimina las entradas vencidas, devuelve cuantas se eliminaron
+    def purge_expired(self) -> int:
+        now = time.time()
+        expired = [
+            key for key, entry in self.cache.items()
+            if now - entry['timestamp'] >= self.retention
+        ]
+        for key in expired:
+            self._remove(key)
+        self.stats['expirations'] += len(expired)
+        return len(expired)
+
+    # Tarea de fondo que purga entradas vencidas periodicamente
+    async def expiry_loop(self, interval: int = 60):
+        while True:
+            await asyncio.sleep(interval)
+            removed = self.purge_expired()
+            if self.disk:
+                try:
+                    removed += await self._run_disk(self.disk.purge_expired)
+                except (sqlite3.Error, OSError) as e:
+                    print(f"[CACHE DISK ERROR] No se pudo purgar el cache en disco: {e}")
+            if removed:
+                print(f"[CACHE PURGE] {removed} entradas vencidas eliminadas")
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            'entries': len(self.cache),
+            'current_bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'policy': self.policy,
+            'disk': self.disk.path if self.disk else None
+        }
+
     def clear(self):
         self.cache.clear()
+        self.current_bytes = 0
         print("Cache limpiado")
 
+    # Cierra el cache en disco y su thread
+    async def close(self):
+        if self.disk:
+            await self._run_disk(self.disk.close)
+            self.disk_executor.shutdown(wait=True)
+
+    # Ejecuta una operacion del DiskCache en su thread, sin bloquear el event loop
+    def _run_disk(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.disk_executor, func, *args)
+
+    # Desaloja una entrada segun la politica configurada
+    def _evict(self):
+        if self.policy == 'lfu':
+            key = min(self.cache, key=lambda k: self.cache[k]['hits'])
+        else:
+            key = next(iter(self.cache))
+        self._remove(key)
+        self.stats['evictions'] += 1
+        print(f"[CACHE EVICT] {key}")
+
+    def _remove(self, key: str):
+        entry = self.cache.pop(key)
+        self.current_bytes -= entry['size']
+
+    # Estima el tamaño de una entrada. Los artefactos en disco (FileArtifact) se cuentan
+    # por el tamaño del archivo, asi el limite del cache tambien acota el disco que ocupan;
+    # al desalojarse la entrada el archivo se borra si ninguna tarea lo sigue usando.
+    def _entry_size(self, obj) -> int:
+        if isinstance(obj, dict):
+            return sum(len(k) + self._entry_size(v) for k, v in obj.items())
+        if isinstance(obj, list):
+            return sum(self._entry_size(v) for v in obj)
+        if isinstance(obj, str):
+            return len(obj.encode('utf-8'))
+        if isinstance(obj, (bytes, bytearray)):
+            return len(obj)
+        if isinstance(obj, FileArtifact):
+            return obj.size
+        return 8
+
 
 # Rate Limiter 
 class RateLimiter:
@@ -79,6 +416,49 @@ class RateLimiter:
 
 
 
+# Pool de conexiones persistentes con el servidor de procesamiento.
+# Cada conexion multiplexa varias requests; se usa la de menos requests en curso.
+# Con artifacts_dir las respuestas se piden en streaming y el screenshot y los
+# thumbnails se escriben directamente a archivos en ese directorio.
+class ProcessorPool:
+
+    def __init__(self, host: str, port: int, size: int = 2, artifacts_dir: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.artifacts_dir = artifacts_dir
+        self.connections = []
+        self.lock = asyncio.Lock()
+
+    async def request(self, data: Dict, timeout: float) -> Dict:
+        connection = await self._acquire()
+        sink_factory = None
+        if self.artifacts_dir:
+            sink_factory = lambda: FileArtifactSink(self.artifacts_dir)
+        return await connection.request(data, timeout=timeout, sink_factory=sink_factory)
+
+    async def close(self):
+        connections, self.connections = self.connections, []
+        await asyncio.gather(*(c.close() for c in connections), return_exceptions=True)
+
+    # Devuelve la conexion menos cargada, abriendo una nueva si el pool no esta completo
+    async def _acquire(self) -> MultiplexedConnection:
+        async with self.lock:
+            self.connections = [c for c in self.connections if not c.closed]
+
+            idle = [c for c in self.connections if c.in_flight == 0]
+            if idle:
+                return idle[0]
+
+            if len(self.connections) < self.size:
+                connection = await MultiplexedConnection.open(self.host, self.port)
+                self.connections.append(connection)
+                print(f"Nueva conexión con Servidor B ({len(self.connections)}/{self.size})")
+                return connection
+
+            return min(self.connections, key=lambda c: c.in_flight)
+
+
 # Sistema de gestor de tareas
 class TaskManager:
     
@@ -119,6 +499,11 @@ class TaskManager:
 
 
 
+PROCESSOR_BUSY_RETRIES = 3
+PROCESSOR_FAILED_STATUSES = ('busy', 'error')
+SCRAPE_PRIORITIES = ('interactive', 'normal', 'bulk')
+
+
 # Variables globales
 cache = None
 rate_limiter = None
@@ -126,6 +511,15 @@ task_manager = None
 processor_host = None
 processor_port = None
 process_pool = None
+inflight_scrapes = None
+revalidations = None
+http_session = None
+max_body_size = None
+parser_backend = None
+html_transfer = None
+processor_pool = None
+forward_html = None
+trusted_proxies = None
 
 
 
@@ -141,9 +535,26 @@ async def handle_scrape(request):
                 status=400
             )
         
+        priority = data.get('priority', 'normal')
+        if priority not in SCRAPE_PRIORITIES:
+            return web.json_response(
+                {'error': f"Prioridad inválida, usar una de: {', '.join(SCRAPE_PRIORITIES)}"},
+                status=400
+            )
+        client = data.get('client')
+        if client is not None and not isinstance(client, str):
+            return web.json_response(
+                {'error': "El campo 'client' debe ser un string"},
+                status=400
+            )
+        # Solo un origen de confianza (gateway/proxy) puede elegir el cliente para el
+        # reparto del Servidor B; el resto se identifica por su IP
+        if not client or request.remote not in trusted_proxies:
+            client = request.remote
+
         task_id = task_manager.create_task(url)
         
-        task = asyncio.create_task(process_scraping_task(request.app, task_id, url))
+        task = asyncio.create_task(process_scraping_task(request.app, task_id, url, priority, client))
         
 
         request.app['active_tasks'].add(task)
@@ -200,15 +611,53 @@ async def handle_result(request):
             'status': task['status']
         }, status=400)
     
-    return web.json_response(task['result'])
+    return await json_stream_response(request, task['result'])
+
+
+# Responde un resultado en JSON. Los bytes (screenshot/thumbnails binarios) se pasan a base64
+# y los artefactos en disco (FileArtifact) se escriben por partes, leyendo y codificando cada
+# parte fuera del event loop, asi el resultado con sus artefactos nunca esta entero en memoria.
+async def json_stream_response(request, data: Dict) -> web.StreamResponse:
+    loop = asyncio.get_running_loop()
+    parts, artifacts = await loop.run_in_executor(None, serialize_parts, data)
+
+    response = web.StreamResponse(headers={'Content-Type': 'application/json; charset=utf-8'})
+    await response.prepare(request)
+
+    await response.write(parts[0].encode('utf-8'))
+    for artifact, part in zip(artifacts, parts[1:]):
+        chunks = artifact.iter_base64()
+        while True:
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                break
+            await response.write(chunk)
+        await response.write(part.encode('utf-8'))
+
+    await response.write_eof()
+    return response
+
+
+async def handle_cache_stats(request):
+    return web.json_response(cache.get_stats())
+
+
+# Estadisticas de los pools de procesos del servidor B (uso, cola, tareas vencidas)
+async def handle_processor_stats(request):
+    try:
+        response = await processor_pool.request({'stats': True}, timeout=5)
+    except Exception as e:
+        return web.json_response({'error': f"No se pudo consultar al servidor de procesamiento: {e}"}, status=502)
+    return web.json_response(response)
 
 
 
 # Inicia y termina el proceso de scrapping
-async def process_scraping_task(app, task_id: str, url: str):
+async def process_scraping_task(app, task_id: str, url: str, priority: str = 'normal',
+                                client: Optional[str] = None):
     try:
         task_manager.update_status(task_id, 'scraping')
-        result = await full_scraping_process(url)
+        result = await single_flight_scraping(url, priority, client)
         task_manager.set_result(task_id, result)
     
     except Exception as e:
@@ -219,21 +668,128 @@ async def process_scraping_task(app, task_id: str, url: str):
         app['active_tasks'].discard(asyncio.current_task())
 
 
+# Comparte un unico scraping entre todas las requests concurrentes de la misma URL.
+# El scraping compartido usa la prioridad y el cliente de la request que lo inicio. Si llega
+# una request de mayor prioridad se inicia otro scraping con su prioridad, que reemplaza al
+# anterior: este se cancela (y con el sus tareas en el Servidor B) y quienes lo esperaban
+# pasan a esperar el nuevo, asi nadie queda esperando en un nivel menor al propio.
+async def single_flight_scraping(url: str, priority: str = 'normal', client: Optional[str] = None) -> Dict:
+    entry = inflight_scrapes.get(url)
+
+    if entry is None:
+        entry = start_shared_scraping(url, priority, client)
+    elif not entry['task'].done() and SCRAPE_PRIORITIES.index(priority) < SCRAPE_PRIORITIES.index(entry['priority']):
+        print(f"[SINGLE FLIGHT] {url} en proceso con prioridad '{entry['priority']}', "
+              f"se reinicia con '{priority}'")
+        entry = start_shared_scraping(url, priority, client, replaces=entry)
+    else:
+        print(f"[SINGLE FLIGHT] {url} ya en proceso, esperando resultado compartido")
+
+    while True:
+        try:
+            # shield: si se cancela una de las tareas que espera, el scraping compartido sigue
+            return await asyncio.shield(entry['task'])
+        except asyncio.CancelledError:
+            if entry['replaced_by'] is None or not entry['task'].cancelled():
+                raise
+            entry = entry['replaced_by']
+
+
+# Inicia el scraping compartido de una URL. Con replaces, cancela el scraping en curso
+# y deja registrado el nuevo para que lo sigan quienes esperaban al anterior.
+def start_shared_scraping(url: str, priority: str, client: Optional[str] = None,
+                          replaces: Optional[Dict] = None) -> Dict:
+    entry = {
+        'task': asyncio.ensure_future(full_scraping_process(url, priority, client)),
+        'priority': priority,
+        'replaced_by': None
+    }
+    inflight_scrapes[url] = entry
+
+    def _release(fut):
+        current = inflight_scrapes.get(url)
+        if current is not None and current['task'] is fut:
+            del inflight_scrapes[url]
+
+    entry['task'].add_done_callback(_release)
+
+    if replaces is not None:
+        replaces['replaced_by'] = entry
+        replaces['task'].cancel()
+
+    return entry
+
+
 # Ejecuta las tareas de scrapping
-async def full_scraping_process(url: str) -> Dict:
-    from urllib.parse import urlparse
-    
-    domain = urlparse(url).netloc
-    
-    cached_result = cache.get(url)
+async def full_scraping_process(url: str, priority: str = 'normal', client: Optional[str] = None) -> Dict:
+    cached_result = await cache.get(url)
     if cached_result:
         cached_result['from_cache'] = True
         return cached_result
+
+    if cache.stale_seconds:
+        stale = await cache.get_stale(url)
+        if stale:
+            stale_result, validators = stale
+            start_revalidation(url, stale_result, validators, client)
+            return {**stale_result, 'from_cache': True, 'stale': True}
+    
+    return await run_scraping_pipeline(url, priority=priority, client=client)
+
+
+# Lanza en segundo plano la revalidacion de una entrada vencida (una sola por URL).
+# Nadie espera su resultado, por lo que se procesa con prioridad 'bulk'.
+def start_revalidation(url: str, stale_result: Dict, validators: Dict, client: Optional[str] = None):
+    if url in revalidations:
+        return
+
+    task = asyncio.ensure_future(run_scraping_pipeline(url, stale_result, validators, 'bulk', client))
+    revalidations[url] = task
+
+    def _done(fut):
+        revalidations.pop(url, None)
+        if not fut.cancelled() and fut.exception():
+            print(f"[REVALIDATE] Error revalidando {url}: {fut.exception()}")
+
+    task.add_done_callback(_done)
+    print(f"[REVALIDATE] Revalidando {url} en segundo plano")
+
+
+# Realiza el fetch y las tareas de scrapping. Si se recibe un resultado previo y sus
+# validadores, el fetch es condicional y un 304 reutiliza el resultado sin reprocesar.
+async def run_scraping_pipeline(url: str, stale_result: Optional[Dict] = None,
+                                validators: Optional[Dict] = None, priority: str = 'normal',
+                                client: Optional[str] = None) -> Dict:
+    from urllib.parse import urlparse
+    
+    domain = urlparse(url).netloc
+    validators = validators or {}
     
     await rate_limiter.wait_if_needed(domain)
     
     print(f"Iniciando scraping de {url}")
-    fetch_result = await fetch_url(url, timeout=30)
+    fetch_result = await fetch_url(
+        url,
+        timeout=30,
+        etag=validators.get('etag'),
+        last_modified=validators.get('last_modified'),
+        session=http_session,
+        max_size=max_body_size
+    )
+
+    if fetch_result['status'] == 304 and stale_result:
+        print(f"[REVALIDATE] {url} sin cambios (304), se reutiliza el resultado")
+        result = {
+            **stale_result,
+            'timestamp': datetime.now().isoformat(),
+            'from_cache': False
+        }
+        await cache.set(url, result, {
+            'etag': fetch_result.get('etag') or validators.get('etag'),
+            'last_modified': fetch_result.get('last_modified') or validators.get('last_modified')
+        })
+        return result
+
     html_content = fetch_result['html']
     url_final = fetch_result['url_final']
 
@@ -241,29 +797,37 @@ async def full_scraping_process(url: str) -> Dict:
     
     loop = asyncio.get_event_loop()
     
-    scraping_data, metadata, processing_data = await asyncio.gather(
-        loop.run_in_executor(process_pool, parse_html, html_content, url_final),
-        loop.run_in_executor(process_pool, extract_metadata, html_content),
-        communicate_with_processor(url),
-        return_exceptions=True
-    )
+    # En modo 'shm' el HTML se pasa al pool por memoria compartida en vez de serializarlo
+    shared_html = None
+    if html_transfer == 'shm':
+        shared_html = SharedHTML(html_content)
+        analysis = loop.run_in_executor(
+            process_pool, analyze_shared_page,
+            shared_html.name, shared_html.size, url_final, parser_backend
+        )
+    else:
+        analysis = loop.run_in_executor(process_pool, analyze_page, html_content, url_final, parser_backend)
+
+    try:
+        scraping_data, processing_data = await asyncio.gather(
+            analysis,
+            communicate_with_processor(url, fetch_result if forward_html else None, priority, client),
+            return_exceptions=True
+        )
+    finally:
+        if shared_html:
+            shared_html.close()
     
     print(f"Todas las tareas completadas")
     
     if isinstance(scraping_data, Exception):
-        print(f"Error en parse_html: {scraping_data}")
-        scraping_data = {'error': str(scraping_data)}
-    
-    if isinstance(metadata, Exception):
-        print(f"Error en extract_metadata: {metadata}")
-        metadata = {}
+        print(f"Error en analyze_page: {scraping_data}")
+        scraping_data = {'error': str(scraping_data), 'meta_tags': {}}
     
     if isinstance(processing_data, Exception):
         print(f"Error en Servidor B: {processing_data}")
         processing_data = {'status': 'error', 'error': str(processing_data)}
     
-    scraping_data['meta_tags'] = metadata
-    
     result = {
         'url': url,
         'timestamp': datetime.now().isoformat(),
@@ -273,34 +837,48 @@ async def full_scraping_process(url: str) -> Dict:
         'from_cache': False
     }
     
-    cache.set(url, result)
+    # Si el Servidor B siguio ocupado o fallo no se cachea: el resultado no tiene screenshot,
+    # rendimiento ni thumbnails y la proxima request debe volver a intentarlo
+    if processing_data.get('status') in PROCESSOR_FAILED_STATUSES:
+        print(f"[CACHE SKIP] {url} sin datos del Servidor B ({processing_data['status']}), no se cachea")
+    else:
+        await cache.set(url, result, {
+            'etag': fetch_result.get('etag'),
+            'last_modified': fetch_result.get('last_modified')
+        })
     
     return result
 
 
-# Se comunica con el servidor de procesamiento para enviarle la URL sobre la que realizar las tareas
-async def communicate_with_processor(url: str) -> Dict:
+# Se comunica con el servidor de procesamiento para enviarle la URL sobre la que realizar las tareas.
+# Si se pasa el resultado del fetch y fue exitoso (2xx), se reenvia el html para que el servidor B
+# no lo vuelva a descargar; si no, B descarga la pagina y reporta el error como antes.
+# La prioridad y el cliente se usan en B para ordenar las tareas de su pool.
+async def communicate_with_processor(url: str, fetch_result: Optional[Dict] = None,
+                                     priority: str = 'normal', client: Optional[str] = None) -> Dict:
     try:
-        reader, writer = await asyncio.open_connection(
-            processor_host,
-            processor_port
-        )
-        
         request = {
             'url': url,
+            'priority': priority,
         }
+        if client:
+            request['client'] = client
+
+        if fetch_result and 200 <= fetch_result['status'] < 300:
+            request['html'] = fetch_result['html']
+            request['url_final'] = fetch_result['url_final']
+            request['load_time_ms'] = fetch_result['elapsed_ms']
 
         print(f"Enviando URL '{url}' al Servidor B")
         
-        await async_send_message(writer, request)
-        
-        response = await asyncio.wait_for(
-            async_receive_message(reader),
-            timeout=120 
-        )
-        
-        writer.close()
-        await writer.wait_closed()
+        # Si el Servidor B esta saturado responde 'busy'; se reintenta luego de retry_after
+        for attempt in range(PROCESSOR_BUSY_RETRIES):
+            response = await processor_pool.request(request, timeout=120)
+            if response.get('status') != 'busy' or attempt == PROCESSOR_BUSY_RETRIES - 1:
+                break
+            wait_time = response.get('retry_after', 5)
+            print(f"Servidor B ocupado ({response.get('load')}), reintentando en {wait_time}s")
+            await asyncio.sleep(wait_time)
         
         print(f"Respuesta recibida del Servidor B")
         return response
@@ -358,38 +936,167 @@ def parse_arguments():
         default=9001,
         help='Puerto del servidor de procesamiento (default: 9001)'
     )
+
+    parser.add_argument(
+        '--processor-connections',
+        type=int,
+        default=2,
+        help='Conexiones persistentes con el servidor de procesamiento (default: 2)'
+    )
+
+    parser.add_argument(
+        '--forward-html',
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help='Reenviar el HTML descargado al Servidor B para que no lo vuelva a descargar (default: sí)'
+    )
+
+    parser.add_argument(
+        '--trusted-proxy',
+        action='append',
+        default=[],
+        metavar='IP',
+        help="IP autorizada a indicar el cliente en el campo 'client' del request (ej. un gateway); se puede repetir (default: ninguna)"
+    )
+
+    parser.add_argument(
+        '--stream-artifacts',
+        action='store_true',
+        help='Recibir screenshot y thumbnails del Servidor B por partes, guardándolos en disco'
+    )
+
+    parser.add_argument(
+        '--http-limit-per-host',
+        type=int,
+        default=8,
+        help='Conexiones HTTP simultáneas por dominio en el pool (default: 8)'
+    )
+
+    parser.add_argument(
+        '--http-dns-ttl',
+        type=int,
+        default=300,
+        help='Segundos que se cachea la resolución DNS (default: 300)'
+    )
+
+    parser.add_argument(
+        '--max-body-mb',
+        type=int,
+        default=5,
+        help='Tamaño máximo en MB del HTML descargado (default: 5)'
+    )
+
+    parser.add_argument(
+        '--parser-backend',
+        choices=PARSER_BACKENDS,
+        default='lxml',
+        help='Motor de parseo del HTML: lxml (rápido) o bs4 (BeautifulSoup) (default: lxml)'
+    )
+
+    parser.add_argument(
+        '--html-transfer',
+        choices=['shm', 'pickle'],
+        default='shm',
+        help='Cómo se pasa el HTML al pool: memoria compartida (shm) o serializado (pickle) (default: shm)'
+    )
+
+    parser.add_argument(
+        '--cache-max-mb',
+        type=int,
+        default=256,
+        help='Memoria máxima del cache en MB (default: 256)'
+    )
+
+    parser.add_argument(
+        '--cache-policy',
+        choices=['lru', 'lfu'],
+        default='lru',
+        help='Política de desalojo del cache (default: lru)'
+    )
+
+    parser.add_argument(
+        '--cache-dir',
+        default=None,
+        help='Directorio del cache persistente en disco, compartido entre reinicios (default: desactivado)'
+    )
+
+    parser.add_argument(
+        '--stale-while-revalidate',
+        type=int,
+        default=0,
+        metavar='SEGUNDOS',
+        help='Segundos en que un resultado vencido se sigue sirviendo mientras se revalida en segundo plano (default: 0, desactivado)'
+    )
     
     return parser.parse_args()
 
 
 async def init_app(args):
-    global cache, rate_limiter, task_manager, processor_host, processor_port, process_pool
+    global cache, rate_limiter, task_manager, processor_host, processor_port, process_pool, inflight_scrapes, revalidations, max_body_size, parser_backend, html_transfer, processor_pool, forward_html, trusted_proxies
     
-    cache = Cache(ttl_seconds=3600)
+    disk_cache = DiskCache(args.cache_dir, ttl_seconds=3600 + args.stale_while_revalidate) if args.cache_dir else None
+    cache = Cache(
+        ttl_seconds=3600,
+        max_bytes=args.cache_max_mb * 1024 * 1024,
+        policy=args.cache_policy,
+        disk=disk_cache,
+        stale_seconds=args.stale_while_revalidate
+    )
     rate_limiter = RateLimiter(max_requests_per_minute=15)
     task_manager = TaskManager()
     processor_host = args.processor_host
     processor_port = args.processor_port
     process_pool = ProcessPoolExecutor(max_workers=args.workers)
+    inflight_scrapes = {}
+    revalidations = {}
+    max_body_size = args.max_body_mb * 1024 * 1024
+    parser_backend = args.parser_backend
+    html_transfer = args.html_transfer
+    forward_html = args.forward_html
+    trusted_proxies = set(args.trusted_proxy)
+    artifacts_dir = tempfile.mkdtemp(prefix='tp2-artifacts-') if args.stream_artifacts else None
+    processor_pool = ProcessorPool(
+        processor_host,
+        processor_port,
+        size=args.processor_connections,
+        artifacts_dir=artifacts_dir
+    )
     
     app = web.Application()
     
     app.router.add_post('/scrape', handle_scrape)
     app.router.add_get('/status/{task_id}', handle_status)
     app.router.add_get('/result/{task_id}', handle_result)
+    app.router.add_get('/cache/stats', handle_cache_stats)
+    app.router.add_get('/processor/stats', handle_processor_stats)
 
     app['active_tasks'] = set()
+    app['http_limit_per_host'] = args.http_limit_per_host
+    app['http_dns_ttl'] = args.http_dns_ttl
 
+    app.on_startup.append(on_startup)
     app.on_cleanup.append(on_cleanup)
     
     print('SERVIDOR INICIALIZADO. Listo para recibir requests.')
     return app
 
 
+async def on_startup(app):
+    global http_session
+    http_session = create_session(
+        limit_per_host=app['http_limit_per_host'],
+        dns_ttl=app['http_dns_ttl']
+    )
+    app['cache_expiry'] = asyncio.create_task(cache.expiry_loop())
+
+
 async def on_cleanup(app):
     print("Cerrando recursos y tareas...")
 
-    tasks = list(app['active_tasks'])
+    app['cache_expiry'].cancel()
+    await asyncio.gather(app['cache_expiry'], return_exceptions=True)
+
+    tasks = list(app['active_tasks']) + [e['task'] for e in inflight_scrapes.values()] + list(revalidations.values())
 
     if tasks:
         print(f"Cancelando {len(tasks)} tareas en ejecución...")
@@ -398,7 +1105,18 @@ async def on_cleanup(app):
         await asyncio.gather(*tasks, return_exceptions=True)
         print("Todas las tareas canceladas o finalizadas.")
     
-    global process_pool, cache
+    global process_pool, cache, http_session
+    if processor_pool:
+        await processor_pool.close()
+        print("Conexiones con Servidor B cerradas.")
+        if processor_pool.artifacts_dir:
+            shutil.rmtree(processor_pool.artifacts_dir, ignore_errors=True)
+            print("Artefactos temporales eliminados.")
+
+    if http_session:
+        await http_session.close()
+        print("Sesión HTTP cerrada.")
+
     if process_pool:
         process_pool.shutdown(wait=True)
         print("Pool cerrado correctamente.")
@@ -406,6 +1124,9 @@ async def on_cleanup(app):
     if cache:
         cache.clear()
         print("Caché limpiado.")
+        if cache.disk:
+            await cache.close()
+            print("Caché en disco cerrado.")
 
     print("Limpieza de recursos finalizada.")
 
@@ -418,13 +1139,17 @@ def main():
     print(f"Servidor HTTP: {args.ip}:{args.port}")
     print(f"Servidor Procesamiento: {args.processor_host}:{args.processor_port}")
     print(f"Workers: {args.workers}")
-    print(f"Cache TTL: 1 hora")
+    print(f"Parser: {args.parser_backend}")
+    print(f"Cache TTL: 1 hora, máximo {args.cache_max_mb} MB ({args.cache_policy.upper()})")
+    print(f"Cache en disco: {args.cache_dir or 'desactivado'}")
+    print(f"Stale-while-revalidate: {f'{args.stale_while_revalidate}s' if args.stale_while_revalidate else 'desactivado'}")
     print(f"Rate Limit: 15 req/min por dominio")
     print("=" * 60)
     print("\nEndpoints disponibles:")
     print("  POST /scrape              - Crear tarea de scraping (devuelve task_id)")
     print("  GET  /status/{task_id}    - Consultar estado de tarea")
     print("  GET  /result/{task_id}    - Obtener resultado de tarea")
+    print("  GET  /cache/stats         - Estadísticas del cache")
     print("=" * 60)
     print("\nIniciando servidor...")
 